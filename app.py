@@ -1,10 +1,20 @@
 import streamlit as st
-from st_pages import add_page_title, get_nav_from_toml
-import base64
+import toml
+
+from utils.backends import get_setting
+from utils.tracing import configure_logging, render_panel, trace
 
 st.set_page_config(layout="wide", initial_sidebar_state="collapsed", page_icon=":battery:")
-nav = get_nav_from_toml(".streamlit/pages.toml")
+# One st.Page per [[pages]] entry, in file order. toml comes with Streamlit; tomllib would need Python 3.11
+nav = [st.Page(page["path"], title=page["name"], icon=page.get("icon"), url_path=page.get("url_path"))
+       for page in toml.load(".streamlit/pages.toml")["pages"]]
 
 pg = st.navigation(nav)
 
-pg.run()
\ No newline at end of file
+configure_logging(get_setting('TRACE_LOG'))
+with trace('rerun', page=pg.title) as rerun:
+    pg.run()
+
+# ?debug=1 (or the DEBUG_PANEL setting) shows where this rerun spent its time
+if st.query_params.get('debug') == '1' or str(get_setting('DEBUG_PANEL', '')).lower() in ('1', 'true'):
+    render_panel(rerun)
@@ -0,0 +1,183 @@
+"""Headless page benchmarks on synthetic data.
+
+    python -m benchmarks.bench_pages --sizes 10k 100k 1m
+
+Every page runs through Streamlit's AppTest in its own subprocess, first once
+to build the on-disk stores and then again from a cold process. For each page
+and size this reports the cold load time, the median rerun time over a fixed
+set of widget interactions, the peak RSS of the process, and the total Plotly
+figure payload. Any metric above its entry in thresholds.json fails the run,
+and so does a page and size with no entry there.
+The Results page reads a generated snapshot bundle, not Supabase.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ['BatteryViewer', 'DataExplore', 'Results']
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+METRICS = ['cold_s', 'rerun_s', 'peak_rss_mb', 'payload_kb']
+
+
+def _battery_interactions(at):
+    yield lambda: at.selectbox[0].set_value(at.selectbox[0].options[1])
+    yield lambda: at.selectbox[1].set_value('Structural Encoding')
+    yield lambda: at.multiselect[0].set_value(['Li', 'O'])
+    yield lambda: at.multiselect(key='excluded_elements').set_value(['Co'])
+    yield lambda: at.selectbox(key='element_subset').set_value('Environmental Impact Features')
+
+
+def _explore_interactions(at):
+    yield lambda: at.selectbox[0].set_value('Environmental Impact Features')
+    yield lambda: at.selectbox[1].set_value('UK_Critical')
+    yield lambda: at.selectbox[0].set_value('Socioeconomic Impact Features')
+
+
+def _results_interactions(at):
+    yield lambda: at.selectbox(key='target_select_lr').set_value(at.selectbox(key='target_select_lr').options[1])
+    yield lambda: at.multiselect(key='xgboost_features').set_value(['Battery Properties'])
+    yield lambda: at.selectbox(key='target_select_xgb').set_value(at.selectbox(key='target_select_xgb').options[2])
+
+
+INTERACTIONS = {
+    'BatteryViewer': _battery_interactions,
+    'DataExplore': _explore_interactions,
+    'Results': _results_interactions,
+}
+
+
+def _peak_rss_mb():
+    # VmHWM is per address space; ru_maxrss would also count the parent's memory at fork time
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _payload_bytes(at):
+    return sum(len(chart.proto.spec) for chart in at.get('plotly_chart'))
+
+
+def _raise_on_exception(at, page):
+    if at.exception:
+        raise RuntimeError(f'{page} raised: {at.exception[0].message}')
+
+
+def run_worker(page, work_dir):
+    # Runs inside the subprocess: pages resolve data/ relative to the working directory
+    os.chdir(work_dir)
+    sys.path.insert(0, REPO_ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, 'pages', f'{page}.py'), default_timeout=1800)
+    start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - start
+    _raise_on_exception(at, page)
+    payload = _payload_bytes(at)
+
+    reruns = []
+    for interact in INTERACTIONS[page](at):
+        interact()
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+        _raise_on_exception(at, page)
+        payload = max(payload, _payload_bytes(at))
+
+    return {
+        'cold_s': cold,
+        'rerun_s': statistics.median(reruns),
+        'peak_rss_mb': _peak_rss_mb(),
+        'payload_kb': payload / 1024,
+    }
+
+
+def _spawn(page, work_dir):
+    env = dict(os.environ,
+               BATTIMPACT_RESULTS_BACKEND='snapshot',
+               BATTIMPACT_RESULTS_SNAPSHOT_DIR=os.path.join(work_dir, 'data', 'snapshot'),
+               BATTIMPACT_IMAGE_CACHE_DIR=os.path.join(work_dir, 'data', '.image_cache'),
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, '-m', 'benchmarks.bench_pages', '--worker', page, work_dir],
+                               cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{page} benchmark failed:\n{completed.stderr[-4000:]}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_suite(sizes, pages, data_root):
+    from benchmarks.datasets import prepare
+
+    results = {}
+    for size in sizes:
+        work_dir = os.path.join(data_root, size)
+        start = time.perf_counter()
+        prepare(work_dir, SIZES[size])
+        print(f'[{size}] datasets ready in {time.perf_counter() - start:.1f}s', flush=True)
+        for page in pages:
+            # The first process pays the one-time store conversion; the second measures a cold worker
+            build = _spawn(page, work_dir)
+            metrics = _spawn(page, work_dir)
+            metrics['build_s'] = build['cold_s']
+            results.setdefault(page, {})[size] = metrics
+            print(f'[{size}] {page}: ' + ', '.join(f'{name}={metrics[name]:.2f}' for name in ['build_s'] + METRICS),
+                  flush=True)
+    return results
+
+
+def check_thresholds(results, thresholds):
+    failures = []
+    for page, by_size in results.items():
+        for size, metrics in by_size.items():
+            limits = thresholds.get(page, {}).get(size)
+            # A page and size without limits would pass whatever it measured
+            if not limits:
+                failures.append(f'{page} [{size}]: no thresholds in thresholds.json')
+                continue
+            for name, limit in limits.items():
+                if metrics.get(name, 0) > limit:
+                    failures.append(f'{page} [{size}] {name}: {metrics[name]:.2f} > {limit}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['10k', '100k'])
+    parser.add_argument('--pages', nargs='+', choices=PAGES, default=PAGES)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'battimpact-bench'),
+                        help='where generated datasets are kept between runs')
+    parser.add_argument('--thresholds', default=os.path.join(REPO_ROOT, 'benchmarks', 'thresholds.json'))
+    parser.add_argument('--output', help='also write the measurements to this JSON file')
+    parser.add_argument('--worker', nargs=2, metavar=('PAGE', 'WORK_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(*args.worker)))
+        return
+
+    results = run_suite(args.sizes, args.pages, args.data_dir)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+    with open(args.thresholds, encoding='utf-8') as f:
+        failures = check_thresholds(results, json.load(f))
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
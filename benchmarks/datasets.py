@@ -0,0 +1,132 @@
+"""Synthetic datasets with the same schemas as the files the pages read."""
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.backends import SQLiteBackend
+from utils.features import feature_dictionary, target_option_dict
+from utils.results_funcs import DETAIL_TABLES, MODEL_TABLES, VISUAL_BUCKETS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKING_IONS = ['Al', 'Ca', 'Cs', 'K', 'Li', 'Mg', 'Na', 'Rb', 'Y', 'Zn']
+CRITICALITY_COLUMNS = ['UK_Critical', 'US_Critical', 'EU_Critical']
+MODEL_SUBSETS = ['Structural Encoding', 'Battery Properties', 'Environmental Impact Features',
+                 'Socioeconomic Impact Features']
+XGBOOST_VIS_TYPES = ['importance', 'rfecv', 'learning_curve', 'parity', 'feature_importance', 'network',
+                     'n_sii', 'force_SV', 'force_n_SII', 'waterfall_SV', 'waterfall_n_sii']
+LINEAR_VIS_TYPES = ['rfecv', 'importance', 'venn']
+
+
+def battery_frame(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        'battery_id': [f'mp-{i}_{WORKING_IONS[i % len(WORKING_IONS)]}' for i in range(num_rows)],
+        'working_ion': rng.choice(WORKING_IONS, num_rows),
+    }
+    # Composition columns are mostly zero, like the real formula encoding
+    for feature in feature_dictionary['Structural Encoding']:
+        values = rng.random(num_rows, dtype=np.float32)
+        values[rng.random(num_rows) > 0.08] = 0
+        columns[feature] = values
+    for subset, features in feature_dictionary.items():
+        if subset == 'Structural Encoding':
+            continue
+        for feature in features:
+            if not feature.startswith('working_ion_'):
+                columns[feature] = rng.normal(size=num_rows).astype(np.float32)
+    # A slice of negative energies exercises the loader's energy_grav filter
+    columns['energy_grav'] = rng.normal(1.0, 0.6, num_rows).astype(np.float32)
+    for column in CRITICALITY_COLUMNS:
+        columns[column] = rng.random(num_rows, dtype=np.float32)
+    return pd.DataFrame(columns)
+
+
+def tsne_frame(batteries, methods, seed=1):
+    rng = np.random.default_rng(seed)
+    columns = {'battery_id': batteries['battery_id']}
+    for method in methods:
+        centres = rng.normal(scale=30, size=(8, 2))
+        points = centres[rng.integers(0, len(centres), len(batteries))] + rng.normal(size=(len(batteries), 2))
+        columns[f'{method}_x'] = points[:, 0].astype(np.float32)
+        columns[f'{method}_y'] = points[:, 1].astype(np.float32)
+    targets = dict.fromkeys(target for targets in target_option_dict.values() for target in targets)
+    for target in targets:
+        columns[target] = batteries[target]
+    return pd.DataFrame(columns)
+
+
+def results_tables(seed=2):
+    rng = np.random.default_rng(seed)
+    targets = list(dict.fromkeys(target for targets in target_option_dict.values() for target in targets))
+    tables = {}
+    next_id = itertools.count(1)
+    for model_type, model_table in MODEL_TABLES.items():
+        detail = DETAIL_TABLES[model_type]
+        tables[model_table] = []
+        for table_name in detail.values():
+            tables[table_name] = []
+        vis_types = LINEAR_VIS_TYPES if model_type == 'Linear Regression' else XGBOOST_VIS_TYPES
+        for size in range(1, len(MODEL_SUBSETS) + 1):
+            for subset in itertools.combinations(MODEL_SUBSETS, size):
+                for target in targets:
+                    model_id = next(next_id)
+                    tables[model_table].append({
+                        'id': model_id, 'feature_subset': list(subset), 'response_variable': target,
+                        'r_squared': float(rng.random()), 'rmse': float(rng.random()), 'mae': float(rng.random()),
+                    })
+                    for vis_type in vis_types:
+                        tables[detail['visualizations']].append(
+                            {'model_id': model_id, 'vis_type': vis_type, 'file_path': f'{model_id}/{vis_type}.png'})
+                    for feature in rng.choice(feature_dictionary[subset[0]], 5):
+                        tables[detail['selected_features']].append({'model_id': model_id, 'feature_name': feature})
+                        tables[detail['feature_importance']].append(
+                            {'model_id': model_id, 'feature_name': feature, 'importance': float(rng.random())})
+                    if model_type == 'Linear Regression':
+                        tables['coefficient_info'].append(
+                            {'model_id': model_id, 'feature_name': subset[0], 'coefficient': float(rng.normal()),
+                             'p_value': float(rng.random())})
+                    else:
+                        tables['xgboost_hyperparameters'].append(
+                            {'model_id': model_id, 'max_depth': int(rng.integers(2, 8)),
+                             'learning_rate': float(rng.random()), 'n_estimators': int(rng.integers(50, 500))})
+    return tables
+
+
+def write_results_bundle(bundle_dir):
+    """A snapshot-format bundle (see utils.snapshot) acting as the local Supabase stand-in."""
+    from PIL import Image
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    database = SQLiteBackend(os.path.join(bundle_dir, 'results.sqlite'))
+    tables = results_tables()
+    for table_name, rows in tables.items():
+        database.write_table(table_name, rows)
+    database.connection.close()
+
+    plot_path = os.path.join(bundle_dir, 'plot.png')
+    Image.new('RGB', (1800, 1200), (90, 140, 200)).save(plot_path)
+    for model_type, detail in DETAIL_TABLES.items():
+        for row in tables[detail['visualizations']]:
+            target = os.path.join(bundle_dir, 'storage', VISUAL_BUCKETS[model_type], row['file_path'])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                os.link(plot_path, target)
+
+
+def prepare(work_dir, num_rows):
+    """Create work_dir/data/* for num_rows batteries unless it is already there."""
+    data_dir = os.path.join(work_dir, 'data')
+    done_marker = os.path.join(work_dir, '.complete')
+    if os.path.exists(done_marker):
+        return
+    os.makedirs(data_dir, exist_ok=True)
+    evaluations = pd.read_csv(os.path.join(REPO_ROOT, 'data', 'tsne_evaluations.csv'))
+    evaluations.to_csv(os.path.join(data_dir, 'tsne_evaluations.csv'), index=False)
+
+    batteries = battery_frame(num_rows)
+    batteries.to_csv(os.path.join(data_dir, 'mp_total_encoded_normal.csv'), index=False)
+    tsne_frame(batteries, evaluations['method']).to_csv(os.path.join(data_dir, 'tsne_results.csv'), index=False)
+    write_results_bundle(os.path.join(data_dir, 'snapshot'))
+    open(done_marker, 'w').close()
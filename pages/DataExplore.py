@@ -1,38 +1,15 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
-
-target_option_dict = {
-            'Structural Encoding': ['average_voltage', 'capacity_grav', 'energy_grav'],
-             'Battery Properties': ['Price (latest, 1998)'],
-             'Environmental Impact Features': ['Political Stability', 'Demand growth', 'Mining capacity', 
-                                          'Concentration of reserves', 'Concentration of production', 
-                                          'Trade barriers', 'Feasability of exploration projects', 
-                                          'Price volatility', 'Occurence of co-production', 'Primary material use', 
-                                          'Company concentration', '(Non) compliance with social standards', 'ADP (Kg)',
-                                          'average_voltage', 'capacity_grav', 'energy_grav', 'Price (latest, 1998)', 'UK_Critical', 'US_Critical','EU_Critical'],
-             'Socioeconomic Impact Features': ['CCH', 'ODP', 'HT', 'POF', 'PM', 'IR', 'CCE', 'TA', 
-                                          'FE', 'TET', 'FET', 'MET', 'ALO', 'ULO', 'NLT', 'Human Health', 
-                                          'Eco- systems', 'Criticality EI Score', 'US_Critical', 'EU_Critical', 'UK_Critical', 'average_voltage', 'capacity_grav', 'energy_grav'],
-             ('Battery Properties', 'Environmental Impact Features'): ['Political Stability', 'Demand growth', 'Mining capacity', 
-                                          'Concentration of reserves', 'Concentration of production', 
-                                          'Trade barriers', 'Feasability of exploration projects', 
-                                          'Price volatility', 'Occurence of co-production', 'Primary material use', 
-                                          'Company concentration', '(Non) compliance with social standards', 'ADP (Kg)',
-                                          'Price (latest, 1998)', 'UK_Critical', 'US_Critical','EU_Critical'],
-             ('Battery Properties', 'Socioeconomic Impact Features'): ['CCH', 'ODP', 'HT', 'POF', 'PM', 'IR', 'CCE', 'TA', 
-                                          'FE', 'TET', 'FET', 'MET', 'ALO', 'ULO', 'NLT', 'Human Health', 
-                                          'Eco- systems', 'Criticality EI Score', 'US_Critical', 'EU_Critical', 'UK_Critical'],
-             ('Environmental Impact Features', 'Socioeconomic Impact Features'): ['average_voltage', 'capacity_grav', 'energy_grav', 'UK_Critical', 'US_Critical','EU_Critical', 'Price (latest, 1998)'],
-             ('Battery Properties', 'Environmental Impact Features', 'Socioeconomic Impact Features'): ['EU_Critical', 'UK_Critical', 'US_Critical', 'Price (latest, 1998)']
-            }
-
-# @st.cache_data
-def load_data():
-    results = pd.read_csv('data/tsne_results.csv')
-    evaluations = pd.read_csv('data/tsne_evaluations.csv')
-    return results, evaluations
+import plotly.graph_objects as go
 
+from utils.battery_data import get_dataset
+from utils.features import target_option_dict
+from utils.figure_cache import cached_chart
+from utils.plotting import WEBGL_THRESHOLD, density_figure, scatter_render_mode
+from utils.tracing import span
+from utils.tsne_data import (embedding_scores, embedding_subsets, load_data, map_projection, plot_frame, subset_key,
+                             unmapped_rows)
 
 st.title('t-SNE Visualisation Dashboard')
 results, evaluations = load_data()
@@ -40,10 +17,10 @@ results, evaluations = load_data()
 st.markdown("**Select Feature Subset and Target Variable**")
 col1, col2 = st.columns(2)
 with col1:
-    feature_subsets = [col.split('_x')[0] for col in results.columns if col.endswith('_x')]
+    feature_subsets = embedding_subsets(results)
     selected_subset = st.selectbox('Select feature subset:', feature_subsets)
 with col2:
-    target_options = target_option_dict[selected_subset]
+    target_options = target_option_dict[subset_key(selected_subset)]
     selected_target = st.selectbox('Select target variable for color coding:', target_options)
 
 # Display metrics for the selected subset
@@ -52,26 +29,129 @@ subset_metrics = evaluations[evaluations['method'] == selected_subset].iloc[0]
 st.write(f"Trustworthiness: {subset_metrics['trustworthiness']:.4f}")
 st.write(f"Continuity: {subset_metrics['continuity']:.4f}")
 st.write(f"KL Divergence: {subset_metrics['kl_divergence']:.4f}")
+if st.checkbox('Recompute metrics from current data', key=f'recompute_metrics_{selected_subset}'):
+    with span('embedding_scores', subset=selected_subset):
+        scores = embedding_scores(results, get_dataset(), selected_subset)
+    st.write(f"Recomputed trustworthiness: {scores['trustworthiness']:.4f}")
+    st.write(f"Recomputed continuity: {scores['continuity']:.4f}")
+    st.write(f"Recomputed KL divergence: {scores['kl_divergence']:.4f}")
 
 # Prepare data for plotting
-plot_data = results[[f'{selected_subset}_x', f'{selected_subset}_y', selected_target]]
-plot_data.columns = ['x', 'y', 'target']
-
-# Create plot
-fig = px.scatter(plot_data, x='x', y='y', color='target',
-                    color_continuous_scale='Spectral',
-                    title=f't-SNE Visualization: {selected_subset}',
-                    labels={'x': 't-SNE 1', 'y': 't-SNE 2', 'target': selected_target},
-                    hover_data='target')
-
-# Update layout for better visibility
-fig.update_layout(
-    xaxis_title='t-SNE 1',
-    yaxis_title='t-SNE 2',
-    legend_title=selected_target
-)
+with span('plot_frame', subset=selected_subset):
+    plot_data = plot_frame(results, selected_subset, selected_target)
 
-# Display the plot
-st.plotly_chart(fig)
+# Create plot; large embeddings switch to WebGL, then to a binned density raster
+render_mode = scatter_render_mode(len(plot_data))
+x_range = y_range = None
+
+
+def axis_range(label, values, key):
+    low, high = float(values.min()), float(values.max())
+    # st.slider needs two distinct finite bounds; with nothing to zoom into the whole axis is binned
+    if not (np.isfinite(low) and np.isfinite(high)):
+        return (0.0, 1.0)
+    if low == high:
+        return (low - 0.5, high + 0.5)
+    return st.slider(label, low, high, (low, high), key=key)
+
+
+if render_mode == 'density':
+    st.caption(f"{len(plot_data):,} batteries are shown as a density raster coloured by mean {selected_target}. "
+               "Narrow the ranges to zoom in; the grid is re-binned over the selected window.")
+    col1, col2 = st.columns(2)
+    with col1:
+        x_range = axis_range('t-SNE 1 range', plot_data['x'], f'x_range_{selected_subset}')
+    with col2:
+        y_range = axis_range('t-SNE 2 range', plot_data['y'], f'y_range_{selected_subset}')
+
+
+def tsne_figure():
+    # Only needed when the figure is not already cached, and slow to import
+    import plotly.express as px
 
+    if render_mode == 'density':
+        fig = density_figure(plot_data, selected_target, x_range, y_range)
+        fig.update_layout(title=f't-SNE Visualization: {selected_subset}')
+    elif render_mode == 'webgl':
+        fig = px.scatter(plot_data, x='x', y='y', color='target',
+                         color_continuous_scale='Spectral',
+                         title=f't-SNE Visualization: {selected_subset}',
+                         labels={'x': 't-SNE 1', 'y': 't-SNE 2', 'target': selected_target},
+                         render_mode='webgl')
+    else:
+        fig = px.scatter(plot_data, x='x', y='y', color='target',
+                         color_continuous_scale='Spectral',
+                         title=f't-SNE Visualization: {selected_subset}',
+                         labels={'x': 't-SNE 1', 'y': 't-SNE 2', 'target': selected_target},
+                         hover_data='target')
 
+    # Update layout for better visibility
+    fig.update_layout(
+        xaxis_title='t-SNE 1',
+        yaxis_title='t-SNE 2',
+        legend_title=selected_target
+    )
+
+    if placed is not None and len(placed):
+        scatter = go.Scattergl if len(placed) > WEBGL_THRESHOLD else go.Scatter
+        fig.add_trace(scatter(x=placed['x'], y=placed['y'], mode='markers', name='Placed batteries',
+                              marker=dict(symbol='x', color='black', size=7),
+                              hovertext=placed['battery_id'], hoverinfo='text'))
+    return fig
+
+
+# Batteries outside the precomputed map are placed by their nearest mapped neighbours
+with st.expander("Place more batteries on this map"):
+    place_unmapped = st.checkbox("Batteries in the database that are not in this map", key="place_unmapped")
+    uploaded = st.file_uploader("Upload batteries (CSV with this subset's feature columns and a battery_id column)",
+                                type='csv', key="place_upload")
+
+placed = []
+if place_unmapped or uploaded is not None:
+    dataset = get_dataset()
+    projection = map_projection(results, dataset, selected_subset)
+    features = projection.index.features
+    if place_unmapped:
+        rows = unmapped_rows(results, dataset)
+        try:
+            with span('projection', rows=len(rows)):
+                x, y = projection.project(dataset.feature_frame(features, rows))
+        except ValueError as e:
+            st.error(f"Could not place the unmapped batteries: {e}")
+        else:
+            placed.append(pd.DataFrame({'x': x, 'y': y, 'battery_id': dataset.frame['battery_id'].to_numpy()[rows]}))
+    if uploaded is not None:
+        try:
+            new_batteries = pd.read_csv(uploaded)
+        except (ValueError, pd.errors.ParserError) as e:
+            st.error(f"Could not read the uploaded file: {e}")
+            new_batteries = None
+    if uploaded is not None and new_batteries is not None:
+        # A plain working_ion column stands in for the one-hot working_ion_* features
+        if 'working_ion' in new_batteries.columns:
+            for feature in features:
+                if feature.startswith('working_ion_') and feature not in new_batteries.columns:
+                    new_batteries[feature] = (new_batteries['working_ion'] == feature[len('working_ion_'):]).astype(int)
+        absent = [feature for feature in features if feature not in new_batteries.columns]
+        if absent:
+            st.error(f"The uploaded file is missing {len(absent)} feature columns, e.g. {absent[:5]}")
+        else:
+            try:
+                with span('projection', rows=len(new_batteries)):
+                    x, y = projection.project(new_batteries)
+            except (ValueError, KeyError, TypeError) as e:
+                # e.g. text in a feature column, which cannot be converted to numbers
+                st.error(f"Could not place the uploaded batteries: {e}")
+            else:
+                labels = new_batteries['battery_id'] if 'battery_id' in new_batteries.columns else new_batteries.index
+                placed.append(pd.DataFrame({'x': x, 'y': y, 'battery_id': np.asarray(labels).astype(str)}))
+
+placed = pd.concat(placed, ignore_index=True) if placed else None
+placed_key = None
+if placed is not None and len(placed):
+    st.caption(f"{len(placed):,} batteries placed from their {projection.k} nearest mapped neighbours.")
+    placed_key = int(pd.util.hash_pandas_object(placed, index=False).sum())
+
+# Display the plot
+cached_chart(('tsne', results.version, selected_subset, selected_target, render_mode, x_range, y_range, placed_key),
+             tsne_figure, figure='tsne', render_mode=render_mode, rows=len(plot_data))
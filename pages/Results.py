@@ -1,7 +1,12 @@
 import streamlit as st
 import pandas as pd
+import plotly.graph_objects as go
 import numpy as np
-from supabase import create_client, Client
+
+from utils.backends import get_backend
+from utils.image_cache import get_image_cache
+from utils.results_funcs import METRICS, fetch_model_details, metrics_frame, model_index, prefetch_other_targets
+from utils.tracing import span
 
 feature_dictionary = {
     'Structural Encoding': ['Li_formula_discharge', 'C_formula_discharge', 'In_formula_discharge', 
@@ -65,106 +70,83 @@ target_list = [
     'Price (latest, 1998)'
 ]
 
-@st.cache_resource
-def init_connection():
-    SUPABASE_URL = st.secrets["SUPABASE_URL"]
-    SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def get_data(table_name, column_name ='*'):
-    supabase = init_connection()
-    response = supabase.table(table_name).select(column_name).execute()
-    return response.data
-
-if "regression_table" not in st.session_state:
-    st.session_state.regression_table = None
-if "xgboost_table" not in st.session_state:
-    st.session_state.xgboost_table = None
-
-def display_linear_regression_visuals(supabase, result):
+def display_visual(urls, vis_type, missing_message):
+    if vis_type not in urls:
+        st.write(missing_message)
+        return
+    url = urls[vis_type]
+    image_cache = get_image_cache()
+    try:
+        with span('thumbnail', vis_type=vis_type):
+            thumbnail = image_cache.thumbnail(url)
+    except Exception:
+        # Fall back to letting the browser load the original straight from storage
+        if url.startswith(('http://', 'https://')):
+            st.image(url)
+        else:
+            st.write(missing_message)
+        return
+    st.image(thumbnail)
+    if st.toggle("Full resolution", key=f"full_resolution_{url}"):
+        st.image(image_cache.original(url))
+
+def display_linear_regression_visuals(details):
+    urls = details['urls']
+    get_image_cache().warm(urls.values())
     st.subheader("RFECV Results")
-    rfecv_result = supabase.table('visualizations').select('*').eq('model_id', result['id']).eq('vis_type', 'rfecv').execute()
-    if rfecv_result.data:
-        rfecv_url = supabase.storage.from_('Visualisations').get_public_url(rfecv_result.data[0]['file_path'])
-        st.image(rfecv_url)
-    else:
-        st.write("RFECV plot not available for this model.")
+    display_visual(urls, 'rfecv', "RFECV plot not available for this model.")
 
     st.subheader("Feature Importance")
-    importance_result = supabase.table('visualizations').select('*').eq('model_id', result['id']).eq('vis_type', 'importance').execute()
-    if importance_result.data:
-        importance_url = supabase.storage.from_('Visualisations').get_public_url(importance_result.data[0]['file_path'])
-        st.image(importance_url)
-    else:
-        st.write("Feature importance plot not available for this model.")
+    display_visual(urls, 'importance', "Feature importance plot not available for this model.")
 
     # Venn diagram for feature subsets
     st.subheader("Feature Subset Intersection")
-    venn_result = supabase.table('visualizations').select('*').eq('model_id', result['id']).eq('vis_type', 'venn').execute()
-    if venn_result.data:
-        venn_url = supabase.storage.from_('Visualisations').get_public_url(venn_result.data[0]['file_path'])
-        st.image(venn_url)
-    else:
-        st.write("Venn diagram not available for the selected number of feature subsets.")
+    display_visual(urls, 'venn', "Venn diagram not available for the selected number of feature subsets.")
 
-def display_xgboost_visuals(supabase, result):
+def display_xgboost_visuals(details):
+    urls = details['urls']
+    get_image_cache().warm(urls.values())
     # Feature importance
     st.subheader("Feature Importance")
-    importance_result = supabase.table('xgboost_visualizations').select('*').eq('model_id', result['id']).eq('vis_type', 'importance').execute()
-    if importance_result.data:
-        importance_url = supabase.storage.from_('Tree_Visuals').get_public_url(importance_result.data[0]['file_path'])
-        st.image(importance_url)
-    else:
-        st.write("Feature importance plot not available for this model.")
+    display_visual(urls, 'importance', "Feature importance plot not available for this model.")
 
-    visualisation_table = supabase.table('xgboost_visualizations').select('*').eq('model_id', result['id']).execute()
-    if visualisation_table.data:
-        vis_table = pd.DataFrame(visualisation_table.data)
+    if details['visualizations']:
+        missing_message = "Plot not available for this model."
 
         st.subheader("Cross Validation Results")
-        cv_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'rfecv']['file_path'].values[0])
-        st.image(cv_url)
+        display_visual(urls, 'rfecv', missing_message)
 
         st.subheader("Learning Curve")
-        learning_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'learning_curve']['file_path'].values[0])
-        st.image(learning_url)
+        display_visual(urls, 'learning_curve', missing_message)
 
         st.subheader("Parity Plot")
-        parity_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'parity']['file_path'].values[0])
-        st.image(parity_url)
+        display_visual(urls, 'parity', missing_message)
 
         st.subheader("Feature Importance")
-        importance_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'feature_importance']['file_path'].values[0])
-        st.image(importance_url)
+        display_visual(urls, 'feature_importance', missing_message)
 
         st.subheader("SHAP Plots")
         st.write("Network Plot")
-        network_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'network']['file_path'].values[0])
-        st.image(network_url)
+        display_visual(urls, 'network', missing_message)
 
         st.write("N_Sii Plot")
-        n_sii_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'n_sii']['file_path'].values[0])
-        st.image(n_sii_url)
+        display_visual(urls, 'n_sii', missing_message)
 
         st.write("Force Plot")
-        force_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'force_SV']['file_path'].values[0])
-        st.image(force_url)
+        display_visual(urls, 'force_SV', missing_message)
 
         st.write("Force Interaction Plot")
-        force_int_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'force_n_SII']['file_path'].values[0])
-        st.image(force_int_url)
+        display_visual(urls, 'force_n_SII', missing_message)
 
         st.write("Waterfall Plot")
-        waterfall_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'waterfall_SV']['file_path'].values[0])
-        st.image(waterfall_url)
+        display_visual(urls, 'waterfall_SV', missing_message)
 
         st.write("Waterfall Interaction Plot")
-        waterfall_int_url = supabase.storage.from_('Tree_Visuals').get_public_url(vis_table[vis_table['vis_type'] == 'waterfall_n_sii']['file_path'].values[0])
-        st.image(waterfall_int_url)
+        display_visual(urls, 'waterfall_n_sii', missing_message)
     else:
         st.write("No visualizations available for this model.")      
 
-def display_model_details(supabase, result, model_type):
+def display_model_details(backend, result, model_type):
     st.header(f"{model_type} Results")
     col1, col2, col3 = st.columns(3)
 
@@ -172,32 +154,25 @@ def display_model_details(supabase, result, model_type):
     col2.metric("RMSE (test)", f"{result['rmse']:.4f}")
     col3.metric("MAE (test)", f"{result['mae']:.4f}")
 
+    with span('model_details', model_id=result['id']):
+        details = fetch_model_details(backend, result['id'], model_type)
+
     # Display visualizations
     if model_type == "Linear Regression":
-        display_linear_regression_visuals(supabase, result)
+        display_linear_regression_visuals(details)
     else:
-        display_xgboost_visuals(supabase, result)
+        display_xgboost_visuals(details)
     # Display selected features
     st.subheader("Selected Features")
-    if model_type == "Linear Regression":
-        selected_features_result = supabase.table('selected_features').select('*').eq('model_id', result['id']).execute()
-    else:
-        selected_features_result = supabase.table('xgboost_selected_features').select('*').eq('model_id', result['id']).execute()
-
-    if selected_features_result.data:
-        st.write(", ".join([f['feature_name'] for f in selected_features_result.data]))
+    if details['selected_features']:
+        st.write(", ".join([f['feature_name'] for f in details['selected_features']]))
     else:
         st.write("No selected features information available for this model.")
 
     # Display feature importance
     st.subheader("Feature Importance Details")
-    if model_type == "Linear Regression":
-        feature_importance_result = supabase.table('feature_importance').select('*').eq('model_id', result['id']).execute()
-    else:
-        feature_importance_result = supabase.table('xgboost_feature_importance').select('*').eq('model_id', result['id']).execute()
-
-    if feature_importance_result.data:
-        importance_df = pd.DataFrame(feature_importance_result.data)
+    if details['feature_importance']:
+        importance_df = pd.DataFrame(details['feature_importance'])
         importance_df = importance_df.sort_values('importance', ascending=False)
         st.dataframe(importance_df)
     else:
@@ -206,79 +181,106 @@ def display_model_details(supabase, result, model_type):
     # Display coefficient information (for Linear Regression) or hyperparameters (for XGBoost)
     if model_type == "Linear Regression":
         st.subheader("Coefficient Information")
-        coefficient_info_result = supabase.table('coefficient_info').select('*').eq('model_id', result['id']).execute()
-        if coefficient_info_result.data:
-            coef_df = pd.DataFrame(coefficient_info_result.data)
+        if details['coefficient_info']:
+            coef_df = pd.DataFrame(details['coefficient_info'])
             coef_df = coef_df.sort_values('p_value')
             st.dataframe(coef_df)
         else:
             st.write("No coefficient information available for this model.")
     else:
         st.subheader("Hyperparameters")
-        hyperparameters_result = supabase.table('xgboost_hyperparameters').select('*').eq('model_id', result['id']).execute()
-        if hyperparameters_result.data:
-            hyperparam_df = pd.DataFrame(hyperparameters_result.data)
+        if details['hyperparameters']:
+            hyperparam_df = pd.DataFrame(details['hyperparameters'])
             st.dataframe(hyperparam_df)
         else:
             st.write("No hyperparameter information available for this model.")  
 
 
 st.title("Regression Analysis Dashboard")
-supabase = init_connection()
-
-tab1, tab2 = st.tabs(["Linear Regression", "XGBoost"])
+backend = get_backend()
 
-with tab1:
-    # st.header("Linear Regression")
-    model_type = "Linear Regression"
+def display_model_tab(backend, model_type, features_key, target_key):
     col1, col2 = st.columns(2)
     with col1:
-        selected_features = st.multiselect("Select feature subsets:", options=list(feature_dictionary.keys()), default=list(feature_dictionary.keys())[0], key="linear_regression_features")
+        selected_features = st.multiselect("Select feature subsets:", options=list(feature_dictionary.keys()), default=list(feature_dictionary.keys())[0], key=features_key)
+    index = None
+    response_var_options = []
     with st.spinner("Fetching response variables..."):
         try:
-            if st.session_state.regression_table is None:
-                st.session_state.regression_table = get_data('regression_models')
-            response_vars = st.session_state.regression_table
-            response_var_options = [r['response_variable'] for r in response_vars if set(r['feature_subset']) == set(selected_features)]
+            index = model_index(backend, model_type)
+            response_var_options = index.targets(selected_features)
         except Exception as e:
-            st.error(f"Error fetching response variables for Linear Regression: {e}")
+            st.error(f"Error fetching response variables for {model_type}: {e}")
     if not response_var_options:
         response_var_options = ["No available targets for selected features"]
     with col2:
-        response_var = st.selectbox("Select target variable:", response_var_options, key="target_select_lr")
-    results = st.session_state.regression_table
-    # results = get_data('regression_models')
-    filtered_results = [r for r in results if set(r['feature_subset']) == set(selected_features) and r['response_variable'] == response_var]
-    if not filtered_results:
+        response_var = st.selectbox("Select target variable:", response_var_options, key=target_key)
+    result = index.get(selected_features, response_var) if index else None
+    if result is not None:
+        # Users usually step through the targets next, so load their details in the background
+        prefetch_other_targets(st.session_state, backend, get_image_cache(), model_type, index, selected_features,
+                               response_var)
+    if result is None:
         st.warning(f"No results found for the selected combination of features and target variable for {model_type}.")
-    else:    
-        result = filtered_results[0]  # Assume one result per combination
-        display_model_details(supabase, result, model_type)
-with tab2:
-    # st.header("XGBoost")
-    model_type = "XGBoost"
+    else:
+        display_model_details(backend, result, model_type)
+
+def display_leaderboard(backend):
+    metric_labels = {'r_squared': "R-squared", 'rmse': "RMSE", 'mae': "MAE"}
     col1, col2 = st.columns(2)
     with col1:
-        selected_features = st.multiselect("Select feature subsets:", options=list(feature_dictionary.keys()), default=list(feature_dictionary.keys())[0], key="xgboost_features")
-    with st.spinner("Fetching response variables..."):
-        try:
-            if st.session_state.xgboost_table is None:
-                st.session_state.xgboost_table = get_data('xgboost_models')
-            response_vars = st.session_state.xgboost_table
-            response_var_options = [r['response_variable'] for r in response_vars if set(r['feature_subset']) == set(selected_features)]
-        except Exception as e:
-            st.error(f"Error fetching response variables for XGBoost: {e}")
-    if not response_var_options:
-        response_var_options = ["No available targets for selected features"]
+        metric = st.selectbox("Metric:", METRICS, format_func=metric_labels.get, key="leaderboard_metric")
     with col2:
-        response_var = st.selectbox("Select target variable:", response_var_options, key="target_select_xgb")
-    results = st.session_state.xgboost_table
-    # results = get_data('xgboost_models')
-    filtered_results = [r for r in results if set(r['feature_subset']) == set(selected_features) and r['response_variable'] == response_var]
-    if not filtered_results:
-        st.warning(f"No results found for the selected combination of features and target variable for {model_type}.")
-    else:    
-        result = filtered_results[0]  # Assume one result per combination
-        display_model_details(supabase, result, model_type)
-    
+        model_type = st.selectbox("Model type:", ["Linear Regression", "XGBoost"], key="leaderboard_model")
+
+    try:
+        with span('leaderboard_fetch'):
+            metrics = metrics_frame(backend)
+    except Exception as e:
+        st.error(f"Error fetching model metrics: {e}")
+        return
+    if metrics.empty:
+        st.write("No model results available.")
+        return
+
+    # Higher is better for R-squared, lower for the error metrics
+    higher_is_better = metric == 'r_squared'
+    models = metrics[metrics['model_type'] == model_type]
+    pivot = models.pivot(index='feature_subset', columns='response_variable', values=metric)
+    pivot = pivot.loc[pivot.mean(axis=1).sort_values(ascending=not higher_is_better).index]
+
+    with span('figure', figure='leaderboard', cells=pivot.size):
+        fig = go.Figure(go.Heatmap(
+            z=pivot.values,
+            x=pivot.columns,
+            y=pivot.index,
+            colorscale='Viridis',
+            reversescale=not higher_is_better,
+            colorbar=dict(title=metric_labels[metric]),
+            texttemplate="%{z:.2f}",
+            hovertemplate="%{y}<br>%{x}: %{z:.4f}<extra></extra>"
+        ))
+        fig.update_layout(
+            title=f"{model_type} {metric_labels[metric]} by Feature Subset and Target",
+            xaxis_title="Target variable",
+            yaxis=dict(title="Feature subsets", autorange='reversed'),
+            height=max(400, 28 * len(pivot) + 250)
+        )
+    with span('plotly_chart', figure='leaderboard'):
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("Best Model per Target")
+    ranked = metrics.sort_values(metric, ascending=not higher_is_better)
+    best = ranked.drop_duplicates('response_variable').set_index('response_variable').sort_index()
+    st.dataframe(best[['model_type', 'feature_subset'] + METRICS])
+
+tab1, tab2, tab3 = st.tabs(["Linear Regression", "XGBoost", "Leaderboard"])
 
+with tab1:
+    # st.header("Linear Regression")
+    display_model_tab(backend, "Linear Regression", "linear_regression_features", "target_select_lr")
+with tab2:
+    # st.header("XGBoost")
+    display_model_tab(backend, "XGBoost", "xgboost_features", "target_select_xgb")
+with tab3:
+    display_leaderboard(backend)
@@ -0,0 +1,80 @@
+import base64
+import json
+import os
+
+import numpy as np
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from utils import figure_cache
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils import figure_cache
+
+figure_cache.SPEC_PATH = st.session_state.spec_path
+x = np.linspace(0, 1, st.session_state.points)
+figure_cache.cached_chart(('test', figure_cache.SPEC_PATH, len(x)), lambda: go.Figure([
+    go.Scattergl(x=x, y=x ** 2, mode='markers', name='curve'),
+    go.Bar(x=['a', 'b'], y=[1, 2]),
+]).update_layout(title='spec path'), use_container_width=True)
+"""
+
+
+@pytest.fixture(autouse=True)
+def restore_spec_path(monkeypatch):
+    # The script switches the module-level flag; monkeypatch puts it back afterwards
+    monkeypatch.setattr(figure_cache, 'SPEC_PATH', figure_cache.SPEC_PATH)
+
+
+def _decode(value):
+    # plotly.js typed arrays back to plain lists, for comparing with plotly's own JSON
+    if isinstance(value, dict):
+        if set(value) - {'shape'} == {'dtype', 'bdata'}:
+            return np.frombuffer(base64.b64decode(value['bdata']), dtype='<' + value['dtype']).tolist()
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _chart(spec_path, points):
+    at = AppTest.from_string(SCRIPT)
+    at.session_state.spec_path = spec_path
+    at.session_state.points = points
+    at.run()
+    assert not at.exception
+    return at.get('plotly_chart')[0].proto
+
+
+def test_pinned_streamlit_uses_the_spec_path():
+    # Bumping Streamlit past SPEC_PATH_VERSIONS must be a deliberate change, checked by the test below
+    with open(os.path.join(REPO_ROOT, 'requirements.txt'), encoding='utf-8') as f:
+        pinned = next(line.split('==')[1].strip() for line in f if line.startswith('streamlit=='))
+    assert pinned.startswith(figure_cache.SPEC_PATH_VERSIONS)
+    assert st.__version__ == pinned
+    assert figure_cache.SPEC_PATH
+
+
+@pytest.mark.skipif(not figure_cache.SPEC_PATH, reason='the spec path is off on this Streamlit version')
+def test_spec_path_matches_plotly_chart():
+    # Below BINARY_MIN_LENGTH the spec is the same text, so the whole element, widget id included, must match
+    points = figure_cache.BINARY_MIN_LENGTH - 1
+    assert _chart(True, points) == _chart(False, points)
+
+
+@pytest.mark.skipif(not figure_cache.SPEC_PATH, reason='the spec path is off on this Streamlit version')
+def test_spec_path_typed_arrays_decode_to_plotly_json():
+    fast, fallback = _chart(True, 1000), _chart(False, 1000)
+    assert _decode(json.loads(fast.spec)) == json.loads(fallback.spec)
+    fast.ClearField('spec')
+    fallback.ClearField('spec')
+    fast.ClearField('id')
+    fallback.ClearField('id')
+    assert fast == fallback
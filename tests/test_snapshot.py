@@ -0,0 +1,100 @@
+import os
+import random
+
+import pytest
+
+from benchmarks.datasets import results_tables
+from utils import snapshot
+from utils.results_funcs import DETAIL_TABLES, MODEL_TABLES, TABLE_ORDER, VISUAL_BUCKETS
+
+
+class FakeQuery:
+    """The slice of the postgrest request builder that select_all uses."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.order_by = []
+        self.start = self.end = None
+
+    def select(self, columns):
+        return self
+
+    def order(self, column):
+        self.order_by.append(column)
+        return self
+
+    def range(self, start, end):
+        self.start, self.end = start, end
+        return self
+
+    def execute(self):
+        rows = list(self.rows)
+        if self.order_by:
+            # PostgREST rejects an order on a column the table does not have
+            rows.sort(key=lambda row: tuple(row[column] for column in self.order_by))
+        else:
+            # Without an order each request may see the rows in a different sequence
+            random.shuffle(rows)
+        return type('Response', (), {'data': rows[self.start:self.end + 1]})
+
+
+class FakeClient:
+    def __init__(self, tables):
+        self.tables = tables
+        self.storage = self
+
+    def table(self, table_name):
+        return FakeQuery(self.tables[table_name])
+
+    def from_(self, bucket):
+        return self
+
+    def download(self, path):
+        return path.encode()
+
+
+def _sorted(rows):
+    return sorted(rows, key=repr)
+
+
+@pytest.fixture
+def tables():
+    return results_tables()
+
+
+def test_every_exported_table_has_an_order(tables):
+    exported = set(MODEL_TABLES.values()) | {name for detail in DETAIL_TABLES.values() for name in detail.values()}
+    assert exported == set(TABLE_ORDER)
+    for table_name, columns in TABLE_ORDER.items():
+        assert all(column in row for row in tables[table_name] for column in columns)
+
+
+def test_select_all_pages_without_repeats(tables, monkeypatch):
+    monkeypatch.setattr(snapshot, 'PAGE_SIZE', 7)
+    rows = snapshot.select_all(FakeClient(tables), 'visualizations', TABLE_ORDER['visualizations'])
+    assert _sorted(rows) == _sorted(tables['visualizations'])
+
+
+def test_export_snapshot_end_to_end(tables, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, 'PAGE_SIZE', 50)
+    out_dir = str(tmp_path / 'snapshot')
+    client = FakeClient(tables)
+
+    snapshot.export_snapshot(client, out_dir)
+    first = os.readlink(out_dir)
+    backend = snapshot.open_snapshot(out_dir)
+    for table_name, rows in tables.items():
+        assert _sorted(backend.select(table_name)) == _sorted(rows)
+    for model_type, detail in DETAIL_TABLES.items():
+        for row in tables[detail['visualizations']]:
+            with open(backend.public_url(VISUAL_BUCKETS[model_type], row['file_path']), 'rb') as f:
+                assert f.read() == row['file_path'].encode()
+
+    # A re-export swaps the link; the open backend follows it and the bundle before the previous one goes
+    client.tables = {**tables, 'regression_models': tables['regression_models'][:3]}
+    snapshot.export_snapshot(client, out_dir)
+    assert len(backend.select('regression_models')) == 3
+    second = os.readlink(out_dir)
+    snapshot.export_snapshot(client, out_dir)
+    assert sorted(os.listdir(tmp_path)) == sorted(['snapshot', second, os.readlink(out_dir)])
+    assert first not in os.listdir(tmp_path)
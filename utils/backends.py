@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+
+import streamlit as st
+
+from utils.query_cache import QueryCache
+from utils.tracing import span
+
+
+def get_setting(name, default=None):
+    # Environment variables override secrets so tests and deployments can switch backends
+    value = os.environ.get(f'BATTIMPACT_{name}')
+    if value is not None:
+        return value
+    if not st.secrets.load_if_toml_exists():
+        return default
+    return st.secrets.get(name, default)
+
+
+class SupabaseBackend:
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def connect(cls, url, key):
+        from supabase import create_client
+        return cls(create_client(url, key))
+
+    def select(self, table_name, **filters):
+        query = self.client.table(table_name).select('*')
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        return query.execute().data
+
+    def public_url(self, bucket, path):
+        return self.client.storage.from_(bucket).get_public_url(path)
+
+
+class MemoryBackend:
+    """Tables held as lists of row dicts, a stand-in for Supabase in tests and benchmarks."""
+
+    def __init__(self, tables, base_url='http://localhost:54321/storage/v1/object/public'):
+        self.tables = tables
+        self.base_url = base_url
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def select(self, table_name, **filters):
+        return [row for row in self.tables.get(table_name, [])
+                if all(row.get(column) == value for column, value in filters.items())]
+
+    def public_url(self, bucket, path):
+        return f'{self.base_url}/{bucket}/{path}'
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteBackend:
+    """Tables in a local SQLite file; list and dict values are stored as JSON text."""
+
+    def __init__(self, path, storage_dir=None):
+        self.path = path
+        self.storage_dir = storage_dir
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite3 connections must stay on the thread that opened them. A snapshot export swaps in a new
+        # file under the same path, so a connection is reopened once the path leads to a different inode.
+        try:
+            stat = os.stat(self.path)
+            identity = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            identity = None
+        if getattr(self._local, 'identity', None) != identity or not hasattr(self._local, 'connection'):
+            if hasattr(self._local, 'connection'):
+                self._local.connection.close()
+            self._local.connection = sqlite3.connect(self.path)
+            self._local.connection.row_factory = sqlite3.Row
+            self._local.identity = identity
+        return self._local.connection
+
+    def _json_columns(self, table_name):
+        try:
+            rows = self.connection.execute(
+                'SELECT column_name FROM _json_columns WHERE table_name = ?', (table_name,)).fetchall()
+        except sqlite3.OperationalError:
+            return set()
+        return {row[0] for row in rows}
+
+    def write_table(self, table_name, rows):
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        json_columns = {column for row in rows for column, value in row.items() if isinstance(value, (list, dict))}
+        connection = self.connection
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS _json_columns (table_name TEXT, column_name TEXT)')
+            connection.execute('DELETE FROM _json_columns WHERE table_name = ?', (table_name,))
+            connection.executemany('INSERT INTO _json_columns VALUES (?, ?)',
+                                   [(table_name, column) for column in sorted(json_columns)])
+            connection.execute(f'DROP TABLE IF EXISTS {_quote(table_name)}')
+            # An empty table still needs a model_id column so filtered selects return no rows
+            connection.execute(f'CREATE TABLE {_quote(table_name)} ({", ".join(map(_quote, columns or ["model_id"]))})')
+            if rows:
+                placeholders = ', '.join('?' for _ in columns)
+                connection.executemany(
+                    f'INSERT INTO {_quote(table_name)} VALUES ({placeholders})',
+                    [[json.dumps(row.get(c)) if c in json_columns else row.get(c) for c in columns] for row in rows])
+            if 'model_id' in columns:
+                connection.execute(f'CREATE INDEX {_quote(table_name + "_model_id")} ON {_quote(table_name)} (model_id)')
+
+    def select(self, table_name, **filters):
+        where = ' AND '.join(f'{_quote(column)} = ?' for column in filters)
+        sql = f'SELECT * FROM {_quote(table_name)}' + (f' WHERE {where}' if where else '')
+        json_columns = self._json_columns(table_name)
+        rows = []
+        for row in self.connection.execute(sql, list(filters.values())):
+            row = dict(row)
+            for column in json_columns & row.keys():
+                if row[column] is not None:
+                    row[column] = json.loads(row[column])
+            rows.append(row)
+        return rows
+
+    def public_url(self, bucket, path):
+        if self.storage_dir is None:
+            return None
+        return os.path.join(self.storage_dir, bucket, path)
+
+
+class CachedBackend:
+    """Wraps a backend so identical selects are answered from a shared QueryCache."""
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def select(self, table_name, **filters):
+        key = (table_name, tuple(sorted(filters.items())))
+        with span('query', table=table_name, **filters) as attrs:
+            attrs['cache'] = 'hit'
+
+            def load():
+                attrs['cache'] = 'miss'
+                return self.backend.select(table_name, **filters)
+            return self.cache.get_or_load(key, load)
+
+    def public_url(self, bucket, path):
+        with span('storage_url', bucket=bucket):
+            return self.backend.public_url(bucket, path)
+
+
+@st.cache_resource
+def get_backend():
+    kind = get_setting('RESULTS_BACKEND', 'supabase')
+    if kind == 'sqlite':
+        backend = SQLiteBackend(get_setting('RESULTS_SQLITE_PATH'), get_setting('RESULTS_STORAGE_DIR'))
+    elif kind == 'snapshot':
+        from utils.snapshot import open_snapshot
+        backend = open_snapshot(get_setting('RESULTS_SNAPSHOT_DIR', 'data/snapshot'))
+    elif kind == 'memory':
+        backend = MemoryBackend.from_json(get_setting('RESULTS_MEMORY_PATH'))
+    else:
+        backend = SupabaseBackend.connect(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    cache = QueryCache(max_entries=int(get_setting('RESULTS_CACHE_SIZE', 512)),
+                       ttl=float(get_setting('RESULTS_CACHE_TTL', 600)))
+    return CachedBackend(backend, cache)
@@ -0,0 +1,210 @@
+import math
+import threading
+from functools import cached_property
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.backends import get_setting
+from utils.column_store import open_store, source_signature
+from utils.element_index import COMPOSITION_SUFFIX, ElementIndex
+from utils.features import feature_dictionary
+from utils.neighbour_index import NeighbourIndex
+from utils.percentile_index import PercentileIndex
+from utils.query_cache import QueryCache
+from utils.stats_index import STAT_NAMES, build_box_index, build_stats_index
+from utils.tracing import span
+
+DATASET_PATH = 'data/mp_total_encoded_normal.csv'
+NEIGHBOUR_INDEXES = 4
+# Element pairs warmed by precompute_element_stats, most frequent first
+COMMON_PAIRS = 50
+
+
+def _element_stats_bytes(entry):
+    stats, boxes = entry
+    size = int(stats.memory_usage(deep=True).sum())
+    for box in boxes.values():
+        if box is not None:
+            size += box['outliers'].nbytes + 8 * len(box)
+    return size
+
+
+# One per process, so every session exploring the same chemistry shares the aggregation
+element_stats_cache = QueryCache(max_entries=int(get_setting('ELEMENT_STATS_CACHE_SIZE', 4096)), ttl=math.inf,
+                                 max_bytes=int(float(get_setting('ELEMENT_STATS_CACHE_MB', 64)) * 1024 * 1024),
+                                 weigh=_element_stats_bytes)
+
+
+class BatteryData:
+    """The filtered Materials Project battery frame for one dataset version.
+
+    The composition block (``*_formula_discharge``) is held as sparse columns
+    and the working ion as a single categorical column. The ``working_ion_*``
+    indicator features of the models are derived from its codes on demand, so
+    read features through ``column``/``feature_frame`` rather than ``frame``.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.version = store.version
+
+        columns = {}
+        for name in store.columns:
+            values = store.column(name)
+            if name.endswith(COMPOSITION_SUFFIX):
+                values = pd.arrays.SparseArray(values, fill_value=0)
+            columns[name] = values
+        self.frame = pd.DataFrame(columns, copy=False)
+        self.ion_features = {f'working_ion_{ion}': code
+                             for code, ion in enumerate(self.frame['working_ion'].cat.categories)}
+        self.features = [name for name, dtype in self.frame.dtypes.items()
+                         if pd.api.types.is_numeric_dtype(dtype)] + list(self.ion_features)
+        self._neighbours = {}
+        self._neighbours_lock = threading.Lock()
+
+    def column(self, name, rows=None, dense=False):
+        """Values of one feature, for all rows or the given row positions."""
+        if name in self.ion_features:
+            codes = self.frame['working_ion'].cat.codes.to_numpy()
+            codes = codes if rows is None else codes[rows]
+            return (codes == self.ion_features[name]).astype(np.int8)
+        values = self.frame[name].array
+        if isinstance(values, pd.arrays.SparseArray):
+            values = values if rows is None else values.take(rows)
+            return values.to_dense() if dense else values
+        values = np.asarray(values)
+        return values if rows is None else values[rows]
+
+    def feature_frame(self, features, rows=None, dense=False):
+        """Frame of the given features; composition columns stay sparse unless ``dense``."""
+        return pd.DataFrame({name: self.column(name, rows, dense) for name in features}, copy=False)
+
+    @cached_property
+    def stats(self):
+        # Stored columns carry statistics accumulated during ingest; only the ion indicators are computed here
+        stored = [name for name in self.features if name not in self.ion_features]
+        index = pd.DataFrame([self.store.stats(name) for name in stored], index=stored, columns=STAT_NAMES)
+        # The ingest sketch's quartiles are approximate; the box plots beside these tables use exact ones
+        quartiles = ['q1', 'median', 'q3']
+        for name in stored:
+            if self.boxes[name] is not None:
+                index.loc[name, quartiles] = [self.boxes[name][q] for q in quartiles]
+        ions = build_stats_index(self.feature_frame(self.ion_features), list(self.ion_features))
+        return pd.concat([index, ions])
+
+    @cached_property
+    def boxes(self):
+        return build_box_index(self.feature_frame(self.features), self.features)
+
+    @cached_property
+    def elements(self):
+        return ElementIndex(self.frame)
+
+    @cached_property
+    def percentiles(self):
+        return PercentileIndex(self.feature_frame(self.features))
+
+    def neighbours(self, features):
+        """Nearest-neighbour index over ``features``; the most recently used few are kept per dataset version."""
+        key = tuple(features)
+        # The dataset is shared by every session; the lock also keeps two of them from building the same index
+        with self._neighbours_lock:
+            index = self._neighbours.pop(key, None)
+            if index is None:
+                index = NeighbourIndex(self.feature_frame(key), key)
+            self._neighbours[key] = index
+            while len(self._neighbours) > NEIGHBOUR_INDEXES:
+                self._neighbours.pop(next(iter(self._neighbours)), None)
+        return index
+
+    def element_stats(self, features, all_of=(), any_of=(), none_of=()):
+        """Statistics index and box summaries of ``features`` over the batteries matching an element query.
+
+        Cached process-wide on the sorted element lists, the features and the
+        dataset version, least recently used first out once the cache is full.
+        """
+        features = tuple(features)
+        key = (tuple(sorted(all_of)), tuple(sorted(any_of)), tuple(sorted(none_of)), features, self.version)
+
+        with span('element_group', elements=key[:3]) as attrs:
+            attrs['cache'] = 'hit'
+
+            def load():
+                attrs['cache'] = 'miss'
+                rows = self.elements.rows(self.elements.query(all_of, any_of, none_of))
+                frame = self.feature_frame(features, rows)
+                return build_stats_index(frame, features), build_box_index(frame, features)
+
+            entry = element_stats_cache.get_or_load(key, load)
+            attrs['hit_rate'] = round(element_stats_cache.stats()['hit_rate'], 3)
+        return entry
+
+    @cached_property
+    def _row_of_code(self):
+        codes = np.asarray(self.store.codes('battery_id'))
+        rows = np.full(len(self.store.categories('battery_id')), -1, dtype=np.int64)
+        # A missing battery_id has code -1, which must not land on the last category's slot
+        positions = np.flatnonzero(codes >= 0)
+        # A repeated id resolves to its first row
+        unique_codes, first = np.unique(codes[positions], return_index=True)
+        rows[unique_codes] = positions[first]
+        return rows
+
+    def rows_for(self, battery_ids, strict=True):
+        """Row positions of the given battery ids in ``frame``.
+
+        Unknown ids raise KeyError, or map to -1 when ``strict`` is False.
+        """
+        codes = self.frame['battery_id'].cat.categories.get_indexer(battery_ids)
+        rows = np.where(codes >= 0, self._row_of_code[codes], -1)
+        if strict and (rows < 0).any():
+            missing = [battery_id for battery_id, row in zip(battery_ids, rows) if row < 0]
+            raise KeyError(f"Unknown battery ids: {missing}")
+        return rows
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading battery dataset...")
+def _load_dataset(signature):
+    store = open_store(DATASET_PATH, query='energy_grav >= 0', categorical=['battery_id', 'working_ion'])
+    return BatteryData(store)
+
+
+def precompute_element_stats(dataset, feature_sets, pairs=COMMON_PAIRS):
+    """Fill the element cache for every single element and the ``pairs`` most common element pairs."""
+    index = dataset.elements
+    counts = {(a, b): index.count(index.query([a, b])) for a, b in combinations(index.elements, 2)}
+    common = sorted((pair for pair, count in counts.items() if count), key=counts.get, reverse=True)[:pairs]
+    for elements in [[element] for element in index.elements] + [list(pair) for pair in common]:
+        for features in feature_sets:
+            dataset.element_stats(features, elements)
+
+
+@st.cache_resource(max_entries=1)
+def _start_precompute(_dataset, version, feature_sets):
+    thread = threading.Thread(target=precompute_element_stats, args=(_dataset, feature_sets),
+                              name='element-stats-precompute', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_element_precompute(dataset):
+    """The background thread filling the element cache for ``dataset``, started once per dataset version."""
+    return _start_precompute(dataset, dataset.version,
+                             tuple(tuple(features) for features in feature_dictionary.values()))
+
+
+def element_precompute_enabled():
+    return str(get_setting('ELEMENT_STATS_PRECOMPUTE', '')).lower() in ('1', 'true')
+
+
+def get_dataset():
+    # Keyed on the CSV's mtime/size so an edited source is picked up without a restart
+    with span('dataset_load'):
+        dataset = _load_dataset(tuple(source_signature(DATASET_PATH)))
+    if element_precompute_enabled():
+        # In the background so the first page render is not held up
+        start_element_precompute(dataset)
+    return dataset
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from utils.sketches import ColumnSketch
+
+# Bump whenever the on-disk layout changes so stale stores get rebuilt
+STORE_FORMAT = 2
+MANIFEST = 'manifest.json'
+CHUNK_ROWS = 100_000
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ColumnStore:
+    """Typed, memory-mapped columns converted once from a source CSV.
+
+    Numeric columns are stored as raw float32 arrays, text columns as int32
+    dictionary codes plus a sidecar list of values. Columns are mapped lazily
+    so several processes reading the same store share the page cache.
+    Summary statistics of each numeric column are accumulated while the store
+    is written, so they are available without reading the column.
+    """
+
+    def __init__(self, root, manifest):
+        self.root = root
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.num_rows = manifest['num_rows']
+        self.columns = [spec['name'] for spec in manifest['columns']]
+        self._specs = {spec['name']: spec for spec in manifest['columns']}
+        self._path = os.path.join(root, manifest['version'])
+        self._mapped = {}
+
+    def _map(self, file_name, dtype):
+        if file_name not in self._mapped:
+            path = os.path.join(self._path, file_name)
+            if self.num_rows == 0:
+                self._mapped[file_name] = np.empty(0, dtype=dtype)
+            else:
+                self._mapped[file_name] = np.memmap(path, dtype=dtype, mode='r', shape=(self.num_rows,))
+        return self._mapped[file_name]
+
+    def codes(self, name):
+        spec = self._specs[name]
+        return self._map(spec['file'], spec['dtype'])
+
+    def categories(self, name):
+        spec = self._specs[name]
+        with open(os.path.join(self._path, spec['categories']), encoding='utf-8') as f:
+            return json.load(f)
+
+    def column(self, name):
+        spec = self._specs[name]
+        values = self._map(spec['file'], spec['dtype'])
+        if spec['kind'] == 'categorical':
+            return pd.Categorical.from_codes(values, categories=self.categories(name))
+        return values
+
+    def stats(self, name):
+        """min/q1/median/mean/q3/max/std of a numeric column, as summarised at ingest.
+
+        The quartiles come from a quantile sketch, so they are approximate on
+        large columns; BatteryData.stats replaces them with exact ones.
+        """
+        return self.manifest['stats'][name]
+
+    def to_frame(self, columns=None):
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+
+
+def _read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(root, manifest):
+    tmp_path = os.path.join(root, f'{MANIFEST}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(root, MANIFEST))
+
+
+class _TextColumn(Exception):
+    """A column typed numeric from the first chunk turned out to hold text further down."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+class _Dictionary:
+    # Codes are handed out in order of first appearance, then renumbered into sorted order once all chunks are in
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, series):
+        encoded = pd.Categorical(series.astype('string').astype(object))
+        lookup = np.array([self.codes.setdefault(str(value), len(self.codes)) for value in encoded.categories],
+                          dtype=np.int32)
+        return np.where(encoded.codes >= 0, lookup[encoded.codes] if len(lookup) else -1, -1).astype(np.int32)
+
+    def finish(self, path, chunk_rows):
+        categories = sorted(self.codes)
+        remap = np.empty(len(categories), dtype=np.int32)
+        remap[[self.codes[value] for value in categories]] = np.arange(len(categories), dtype=np.int32)
+        if os.path.getsize(path):
+            codes = np.memmap(path, dtype=np.int32, mode='r+')
+            for start in range(0, len(codes), chunk_rows):
+                block = codes[start:start + chunk_rows]
+                block[block >= 0] = remap[block[block >= 0]]
+            codes.flush()
+            del codes
+        return categories
+
+
+def _is_text(series):
+    return not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series))
+
+
+def _chunks(csv_path, options, chunk_rows):
+    lookups = [(pd.read_csv(path), key) for path, key in options['joins']]
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        if options['query']:
+            chunk = chunk.query(options['query'])
+        for lookup, key in lookups:
+            chunk = chunk.merge(lookup, on=key, how='left')
+        yield chunk
+
+
+def _build_into(csv_path, build_path, options, categorical, chunk_rows):
+    """Stream the source chunk by chunk into one raw file per column, never holding the whole table."""
+    specs, files, dictionaries, sketches = [], {}, {}, {}
+    num_rows = 0
+    try:
+        for chunk in _chunks(csv_path, options, chunk_rows):
+            if not specs:
+                for i, name in enumerate(chunk.columns):
+                    spec = {'name': name, 'file': f'c{i:04d}.bin'}
+                    if name in categorical or _is_text(chunk[name]):
+                        spec.update(kind='categorical', dtype='int32', categories=f'c{i:04d}.json')
+                        dictionaries[name] = _Dictionary()
+                    else:
+                        spec.update(kind='numeric', dtype=options['float_dtype'])
+                        sketches[name] = ColumnSketch()
+                    specs.append(spec)
+                    files[name] = open(os.path.join(build_path, spec['file']), 'wb')
+
+            for spec in specs:
+                name = spec['name']
+                if name in dictionaries:
+                    values = dictionaries[name].encode(chunk[name])
+                elif _is_text(chunk[name]):
+                    raise _TextColumn(name)
+                else:
+                    values = chunk[name].to_numpy(dtype=spec['dtype'], na_value=np.nan)
+                    sketches[name].update(values)
+                values.tofile(files[name])
+            num_rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    for spec in specs:
+        if spec['kind'] == 'categorical':
+            categories = dictionaries[spec['name']].finish(os.path.join(build_path, spec['file']), chunk_rows)
+            with open(os.path.join(build_path, spec['categories']), 'w', encoding='utf-8') as f:
+                json.dump(categories, f)
+    stats = {name: sketch.summary() for name, sketch in sketches.items()}
+    return specs, num_rows, stats
+
+
+def _build(csv_path, root, version, options, chunk_rows):
+    build_path = os.path.join(root, f'{version}.{os.getpid()}.tmp')
+    categorical = set(options['categorical'])
+    while True:
+        shutil.rmtree(build_path, ignore_errors=True)
+        os.makedirs(build_path)
+        try:
+            specs, num_rows, stats = _build_into(csv_path, build_path, options, categorical, chunk_rows)
+            break
+        except _TextColumn as e:
+            # Rare: restart with that column dictionary encoded from the first chunk on
+            categorical.add(e.name)
+        except BaseException:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+
+    # Another worker may have finished the same version first; keep theirs
+    try:
+        os.rename(build_path, os.path.join(root, version))
+    except OSError:
+        shutil.rmtree(build_path, ignore_errors=True)
+
+    return {'format': STORE_FORMAT, 'version': version, 'num_rows': num_rows, 'columns': specs, 'stats': stats}
+
+
+def _remove_stale_versions(root, keep):
+    # The version just replaced stays for stores that still map its columns lazily, and other workers'
+    # <version>.<pid>.tmp build directories are still being written
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if entry not in keep and not entry.endswith('.tmp') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def open_store(csv_path, store_dir=None, query=None, categorical=(), float_dtype='float32', joins=(),
+               chunk_rows=CHUNK_ROWS):
+    """Return the column store for ``csv_path``, converting it if the source changed.
+
+    The source's mtime and size are checked first; the content hash is only
+    recomputed when those differ, so touching the CSV without editing it does
+    not trigger a rebuild. Conversion streams ``chunk_rows`` rows at a time:
+    each chunk is filtered by ``query``, left-joined to every ``(csv_path,
+    key)`` lookup table in ``joins`` and appended to the column files.
+    """
+    if store_dir is None:
+        stem = os.path.splitext(os.path.basename(csv_path))[0]
+        store_dir = os.path.join(os.path.dirname(csv_path), '.store', stem)
+    os.makedirs(store_dir, exist_ok=True)
+
+    joins = [[path, key] for path, key in joins]
+    options = {'query': query, 'categorical': sorted(categorical), 'float_dtype': float_dtype, 'joins': joins}
+    sources = [csv_path] + [path for path, _ in joins]
+    signature = [value for path in sources for value in source_signature(path)]
+    manifest = _read_manifest(store_dir)
+    if (manifest and manifest.get('format') == STORE_FORMAT and manifest['options'] == options
+            and manifest['signature'] == signature):
+        return ColumnStore(store_dir, manifest)
+
+    digest = file_digest(csv_path)
+    join_digests = [file_digest(path) for path, _ in joins]
+    version = hashlib.sha256(json.dumps([STORE_FORMAT, digest, join_digests, options]).encode()).hexdigest()[:16]
+    if not (manifest and manifest.get('format') == STORE_FORMAT and manifest['version'] == version
+            and os.path.isdir(os.path.join(store_dir, version))):
+        previous = manifest.get('version') if manifest else None
+        manifest = _build(csv_path, store_dir, version, options, chunk_rows)
+        _remove_stale_versions(store_dir, {version, previous})
+
+    manifest.update({'options': options, 'signature': signature, 'source_digest': digest})
+    _write_manifest(store_dir, manifest)
+    return ColumnStore(store_dir, manifest)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+COMPOSITION_SUFFIX = '_formula_discharge'
+
+# Set bits per byte value, used to count packed bitmaps without unpacking them
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class ElementIndex:
+    """Packed per-element presence bitmaps over the rows of the battery frame.
+
+    Queries combine bitmaps with bitwise operations, so filtering and counting
+    never touch the composition columns themselves.
+    """
+
+    def __init__(self, frame):
+        self.num_rows = len(frame)
+        self.elements = [col.split('_')[0] for col in frame.columns if col.endswith(COMPOSITION_SUFFIX)]
+        self._bitmaps = {
+            element: np.packbits(self._present(frame[f'{element}{COMPOSITION_SUFFIX}'].array))
+            for element in self.elements
+        }
+        # Padding bits past num_rows stay zero in every query result
+        self._all = np.packbits(np.ones(self.num_rows, dtype=bool))
+
+    def _present(self, values):
+        if isinstance(values, pd.arrays.SparseArray) and values.fill_value == 0:
+            # Only the stored entries of a sparse column can be non-zero
+            present = np.zeros(self.num_rows, dtype=bool)
+            present[values.sp_index.to_int_index().indices[values.sp_values > 0]] = True
+            return present
+        return np.asarray(values) > 0
+
+    def query(self, all_of=(), any_of=(), none_of=()):
+        bits = self._all.copy()
+        for element in all_of:
+            bits &= self._bitmaps[element]
+        if any_of:
+            either = np.zeros_like(bits)
+            for element in any_of:
+                either |= self._bitmaps[element]
+            bits &= either
+        for element in none_of:
+            bits &= ~self._bitmaps[element]
+        return bits
+
+    def count(self, bits):
+        return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+    def rows(self, bits):
+        return np.flatnonzero(np.unpackbits(bits, count=self.num_rows))
@@ -0,0 +1,188 @@
+"""Recompute trustworthiness, continuity and KL divergence for the maps in the t-SNE store.
+
+    python -m utils.embedding_quality --out data/tsne_evaluations.csv
+
+Each map is scored against the battery features of its subset. Distances
+are computed one block of rows at a time, with the block height chosen so a
+block's distance and rank arrays fit in --memory-mb. Blocks are spread over
+a process pool. KL divergence uses the usual t-SNE affinities: perplexity
+calibrated Gaussians over each battery's 3 * perplexity nearest neighbours,
+against Student-t similarities in the map.
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+NEIGHBOURS = 5
+PERPLEXITY = 30.0
+MEMORY_MB = 256
+# float64 distances and membership masks for both spaces, argpartition output and a comparison mask
+BYTES_PER_CELL = 35
+
+_X = _Y = None
+_options = {}
+
+
+def _init_worker(X, Y, k, perplexity):
+    global _X, _Y, _options
+    _X, _Y = X, Y
+    _options = {'k': k, 'perplexity': perplexity}
+
+
+def _squared_distances(points, start, stop):
+    block = points[start:stop]
+    distances = (np.einsum('ij,ij->i', block, block)[:, None] + np.einsum('ij,ij->i', points, points)[None, :]
+                 - 2 * block @ points.T)
+    np.maximum(distances, 0, out=distances)
+    distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+    return distances
+
+
+def _rank_penalty(neighbours, member, distances, k):
+    # Sum of (rank - k) over neighbours in one space that are not neighbours in the other. A rank is a count
+    # of closer points, so only the k candidates per row are compared against the row, nothing is sorted.
+    intruders = ~np.take_along_axis(member, neighbours, axis=1)
+    reach = np.take_along_axis(distances, neighbours, axis=1)
+    total = 0
+    for j in range(neighbours.shape[1]):
+        ranks = (distances < reach[:, j:j + 1]).sum(axis=1) + 1
+        total += int(((ranks - k) * intruders[:, j]).sum())
+    return total
+
+
+def _conditional_affinities(distances, neighbours, perplexity):
+    """p(j|i) over each row's given nearest neighbours, with the Gaussian width bisected to match the perplexity."""
+    squared = np.take_along_axis(distances, neighbours, axis=1)
+    squared = squared - squared.min(axis=1, keepdims=True)
+    target = np.log(perplexity)
+    beta = np.ones(len(squared))
+    low, high = np.zeros(len(squared)), np.full(len(squared), np.inf)
+    for _ in range(64):
+        weights = np.exp(-squared * beta[:, None])
+        total = weights.sum(axis=1)
+        affinities = weights / total[:, None]
+        entropy = np.log(total) + beta * (squared * affinities).sum(axis=1)
+        wide = entropy > target
+        low = np.where(wide, beta, low)
+        high = np.where(wide, high, beta)
+        beta = np.where(np.isinf(high), beta * 2, (low + high) / 2)
+    return affinities
+
+
+def _evaluate_block(start, stop):
+    k, perplexity = _options['k'], _options['perplexity']
+    n = len(_X)
+    dx = _squared_distances(_X, start, stop)
+    dy = _squared_distances(_Y, start, stop)
+    # One partition gives both the k scoring neighbours and the wider affinity neighbourhood
+    num_neighbours = max(k, min(n - 1, int(3 * perplexity)))
+    partition = np.argpartition(dx, sorted({k - 1, num_neighbours - 1}), axis=1)
+    nn_x = partition[:, :k]
+    affinity_neighbours = partition[:, :num_neighbours].copy()
+    del partition
+    nn_y = np.argpartition(dy, k - 1, axis=1)[:, :k]
+    in_x = np.zeros(dx.shape, dtype=bool)
+    in_y = np.zeros(dy.shape, dtype=bool)
+    np.put_along_axis(in_x, nn_x, True, axis=1)
+    np.put_along_axis(in_y, nn_y, True, axis=1)
+
+    trust = _rank_penalty(nn_y, in_x, dx, k)
+    continuity = _rank_penalty(nn_x, in_y, dy, k)
+    # The diagonal is inf, so it adds nothing to the Student-t normaliser
+    normaliser = float((1 / (1 + dy)).sum())
+
+    affinities = _conditional_affinities(dx, affinity_neighbours, perplexity)
+    rows = np.repeat(np.arange(start, stop), num_neighbours)
+    return trust, continuity, normaliser, rows, affinity_neighbours.ravel(), affinities.ravel()
+
+
+def _kl_divergence(Y, rows, cols, conditional, normaliser):
+    n = len(Y)
+    # Symmetrise p(j|i) and p(i|j) into joint affinities that sum to one
+    keys = np.concatenate([rows * n + cols, cols * n + rows])
+    pairs, inverse = np.unique(keys, return_inverse=True)
+    joint = np.bincount(inverse, weights=np.concatenate([conditional, conditional])) / (2 * n)
+    i, j = pairs // n, pairs % n
+    similarity = 1 / (1 + ((Y[i] - Y[j]) ** 2).sum(axis=1)) / normaliser
+    eps = np.finfo(np.float64).tiny
+    return float((joint * np.log(np.maximum(joint, eps) / np.maximum(similarity, eps))).sum())
+
+
+def evaluate_embedding(X, Y, k=NEIGHBOURS, perplexity=PERPLEXITY, workers=1, memory_mb=MEMORY_MB):
+    """Trustworthiness, continuity (both over k neighbours) and t-SNE KL divergence of map Y for data X."""
+    X = np.nan_to_num(np.asarray(X, dtype=np.float64))
+    Y = np.asarray(Y, dtype=np.float64)
+    n = len(X)
+    if n <= 2 * k + 1:
+        raise ValueError(f'Need more than {2 * k + 1} points to score {k} neighbours, got {n}')
+    block_rows = max(1, memory_mb * 1024 * 1024 // (BYTES_PER_CELL * n))
+    blocks = [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+    workers = min(workers, len(blocks))
+
+    if workers > 1:
+        # spawn, not fork: the app server has threads running that a forked child would inherit mid-flight
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(X, Y, k, perplexity)) as pool:
+            parts = list(pool.map(_evaluate_block, *zip(*blocks)))
+    else:
+        _init_worker(X, Y, k, perplexity)
+        parts = [_evaluate_block(start, stop) for start, stop in blocks]
+
+    trust, continuity, normaliser = (sum(part[i] for part in parts) for i in range(3))
+    rows, cols, conditional = (np.concatenate([part[i] for part in parts]) for i in range(3, 6))
+    scale = 2 / (n * k * (2 * n - 3 * k - 1))
+    return {
+        'trustworthiness': 1 - scale * trust,
+        'continuity': 1 - scale * continuity,
+        'kl_divergence': _kl_divergence(Y, rows, cols, conditional, normaliser),
+    }
+
+
+def evaluate_subset(results, dataset, subset, **options):
+    """Scores for one map of the t-SNE store, over the batteries present in both it and the dataset."""
+    from utils.tsne_data import mapped_rows, subset_features
+
+    rows = mapped_rows(results, dataset)
+    mapped = rows >= 0
+    X = dataset.feature_frame(subset_features(subset), rows[mapped], dense=True).to_numpy(dtype=np.float64)
+    Y = np.column_stack([np.asarray(results.column(f'{subset}_{axis}'))[mapped] for axis in 'xy'])
+    return evaluate_embedding(X, Y, **options)
+
+
+def main():
+    from utils.battery_data import get_dataset
+    from utils.tsne_data import embedding_subsets, load_data
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default='data/tsne_evaluations.csv')
+    parser.add_argument('--subsets', nargs='+', help='maps to score (default: all in the t-SNE store)')
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOURS)
+    parser.add_argument('--perplexity', type=float, default=PERPLEXITY)
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per CPU)')
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_MB, help='working memory per process')
+    args = parser.parse_args()
+
+    results, _ = load_data()
+    dataset = get_dataset()
+    columns = ['method', 'trustworthiness', 'continuity', 'kl_divergence']
+    # Scoring only some maps keeps the other rows of an existing file
+    stored = pd.read_csv(args.out) if args.subsets and os.path.exists(args.out) else pd.DataFrame(columns=columns)
+    scores = []
+    for subset in args.subsets or embedding_subsets(results):
+        score = evaluate_subset(results, dataset, subset, k=args.neighbours, perplexity=args.perplexity,
+                                workers=args.workers or os.cpu_count() or 1, memory_mb=args.memory_mb)
+        print(f'{subset}: ' + ', '.join(f'{name}={value:.4f}' for name, value in score.items()))
+        scores.append({'method': subset, **score})
+    scores = pd.DataFrame(scores, columns=columns)
+    order = list(stored['method']) + [method for method in scores['method'] if method not in set(stored['method'])]
+    merged = pd.concat([stored, scores]).drop_duplicates('method', keep='last').set_index('method').loc[order]
+    merged.reset_index().to_csv(args.out, index=False)
+
+
+if __name__ == '__main__':
+    main()
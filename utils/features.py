@@ -0,0 +1,67 @@
+feature_dictionary = {
+    'Structural Encoding': ['Li_formula_discharge', 'C_formula_discharge', 'In_formula_discharge', 
+                            'Bi_formula_discharge', 'Na_formula_discharge', 'Tl_formula_discharge', 
+                            'Sb_formula_discharge', 'K_formula_discharge', 'Rb_formula_discharge', 
+                            'Mg_formula_discharge', 'Mn_formula_discharge', 'O_formula_discharge', 
+                            'Ca_formula_discharge', 'Nb_formula_discharge', 'S_formula_discharge', 
+                            'Co_formula_discharge', 'Al_formula_discharge', 'Cu_formula_discharge', 
+                            'Zn_formula_discharge', 'Ni_formula_discharge', 'Ti_formula_discharge', 
+                            'As_formula_discharge', 'Cs_formula_discharge', 'Sn_formula_discharge', 
+                            'Sc_formula_discharge', 'Si_formula_discharge', 'P_formula_discharge', 
+                            'Mo_formula_discharge', 'Cr_formula_discharge', 'V_formula_discharge', 
+                            'Ge_formula_discharge', 'N_formula_discharge', 'Fe_formula_discharge', 
+                            'Pd_formula_discharge', 'Y_formula_discharge', 'Ga_formula_discharge', 
+                            'Pt_formula_discharge', 'Te_formula_discharge', 'Se_formula_discharge', 
+                            'F_formula_discharge', 'W_formula_discharge', 'Ho_formula_discharge', 
+                            'Ba_formula_discharge', 'Be_formula_discharge', 'La_formula_discharge', 
+                            'Sr_formula_discharge', 'Re_formula_discharge', 'Ta_formula_discharge', 
+                            'Pr_formula_discharge', 'Ir_formula_discharge', 'Cl_formula_discharge', 
+                            'I_formula_discharge', 'Lu_formula_discharge', 'Tb_formula_discharge', 
+                            'Tm_formula_discharge', 'Er_formula_discharge', 'Ag_formula_discharge', 
+                            'Zr_formula_discharge', 'Dy_formula_discharge', 'Cd_formula_discharge', 
+                            'H_formula_discharge', 'Br_formula_discharge', 'Ce_formula_discharge', 
+                            'B_formula_discharge', 'Tc_formula_discharge', 'Rh_formula_discharge', 
+                            'Nd_formula_discharge', 'U_formula_discharge', 'Gd_formula_discharge', 
+                            'Ru_formula_discharge', 'Au_formula_discharge', 'Hg_formula_discharge', 
+                            'Sm_formula_discharge', 'Hf_formula_discharge', 'Yb_formula_discharge', 
+                            'Pb_formula_discharge', 'Eu_formula_discharge'], 
+    'Battery Properties': ['average_voltage', 'capacity_grav', 'energy_grav', 'max_delta_volume', 
+                           'working_ion_Al', 'working_ion_Ca', 'working_ion_Cs', 'working_ion_K', 
+                           'working_ion_Li', 'working_ion_Mg', 'working_ion_Na', 'working_ion_Rb', 
+                           'working_ion_Y', 'working_ion_Zn'], 
+    'Environmental Impact Features': ['ADP (Kg)', 'CCH', 'ODP', 'HT', 'POF', 'PM', 'IR', 'CCE', 'TA', 
+                                      'FE', 'TET', 'FET', 'MET', 'ALO', 'ULO', 'NLT', 'Human Health', 
+                                      'Eco- systems', 'Criticality EI Score'], 
+    'Socioeconomic Impact Features': ['Political Stability', 'Demand growth', 'Mining capacity', 
+                                      'Concentration of reserves', 'Concentration of production', 
+                                      'Trade barriers', 'Feasability of exploration projects', 
+                                      'Price volatility', 'Occurence of co-production', 'Primary material use', 
+                                      'Company concentration', '(Non) compliance with social standards'],
+    'Economic Feature': ['Price (latest, 1998)']
+                                    
+}
+
+target_option_dict = {
+            'Structural Encoding': ['average_voltage', 'capacity_grav', 'energy_grav'],
+             'Battery Properties': ['Price (latest, 1998)'],
+             'Environmental Impact Features': ['Political Stability', 'Demand growth', 'Mining capacity', 
+                                          'Concentration of reserves', 'Concentration of production', 
+                                          'Trade barriers', 'Feasability of exploration projects', 
+                                          'Price volatility', 'Occurence of co-production', 'Primary material use', 
+                                          'Company concentration', '(Non) compliance with social standards', 'ADP (Kg)',
+                                          'average_voltage', 'capacity_grav', 'energy_grav', 'Price (latest, 1998)', 'UK_Critical', 'US_Critical','EU_Critical'],
+             'Socioeconomic Impact Features': ['CCH', 'ODP', 'HT', 'POF', 'PM', 'IR', 'CCE', 'TA', 
+                                          'FE', 'TET', 'FET', 'MET', 'ALO', 'ULO', 'NLT', 'Human Health', 
+                                          'Eco- systems', 'Criticality EI Score', 'US_Critical', 'EU_Critical', 'UK_Critical', 'average_voltage', 'capacity_grav', 'energy_grav'],
+             ('Battery Properties', 'Environmental Impact Features'): ['Political Stability', 'Demand growth', 'Mining capacity', 
+                                          'Concentration of reserves', 'Concentration of production', 
+                                          'Trade barriers', 'Feasability of exploration projects', 
+                                          'Price volatility', 'Occurence of co-production', 'Primary material use', 
+                                          'Company concentration', '(Non) compliance with social standards', 'ADP (Kg)',
+                                          'Price (latest, 1998)', 'UK_Critical', 'US_Critical','EU_Critical'],
+             ('Battery Properties', 'Socioeconomic Impact Features'): ['CCH', 'ODP', 'HT', 'POF', 'PM', 'IR', 'CCE', 'TA', 
+                                          'FE', 'TET', 'FET', 'MET', 'ALO', 'ULO', 'NLT', 'Human Health', 
+                                          'Eco- systems', 'Criticality EI Score', 'US_Critical', 'EU_Critical', 'UK_Critical'],
+             ('Environmental Impact Features', 'Socioeconomic Impact Features'): ['average_voltage', 'capacity_grav', 'energy_grav', 'UK_Critical', 'US_Critical','EU_Critical', 'Price (latest, 1998)'],
+             ('Battery Properties', 'Environmental Impact Features', 'Socioeconomic Impact Features'): ['EU_Critical', 'UK_Critical', 'US_Critical', 'Price (latest, 1998)']
+            }
@@ -0,0 +1,167 @@
+import base64
+import json
+import math
+
+import numpy as np
+import streamlit as st
+
+from utils.backends import get_setting
+from utils.query_cache import QueryCache
+from utils.tracing import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Sending a pre-serialized spec means building st.plotly_chart's message by hand, which relies on Streamlit
+# internals. It is only done on the releases that was checked against; any other goes through st.plotly_chart.
+SPEC_PATH_VERSIONS = ('1.37.',)
+try:
+    from streamlit.elements.form import current_form_id
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from streamlit.runtime.state.common import compute_widget_id
+    SPEC_PATH = st.__version__.startswith(SPEC_PATH_VERSIONS)
+except ImportError:
+    SPEC_PATH = False
+
+# Shorter arrays stay plain JSON lists; the base64 wrapper only pays off on longer ones
+BINARY_MIN_LENGTH = 256
+_TYPED_ARRAY_CODES = {
+    np.dtype(np.float64): 'f8', np.dtype(np.float32): 'f4',
+    np.dtype(np.int32): 'i4', np.dtype(np.uint32): 'u4',
+    np.dtype(np.int16): 'i2', np.dtype(np.uint16): 'u2',
+    np.dtype(np.int8): 'i1', np.dtype(np.uint8): 'u1',
+}
+
+
+def _typed_array(values):
+    # plotly.js has no 64-bit integer arrays, so those go as int32 when they fit and float64 otherwise
+    if values.dtype.kind in 'iu' and values.dtype not in _TYPED_ARRAY_CODES:
+        fits = values.size == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)
+        values = values.astype(np.int32 if fits else np.float64)
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    spec = {'dtype': _TYPED_ARRAY_CODES[values.dtype.newbyteorder('=')],
+            'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ','.join(str(size) for size in values.shape)
+    return spec
+
+
+def _encode_arrays(value):
+    if isinstance(value, dict):
+        return {key: _encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_arrays(item) for item in value]
+    if (isinstance(value, np.ndarray) and value.dtype.kind in 'iuf' and value.size >= BINARY_MIN_LENGTH
+            and value.ndim <= 3):
+        return _typed_array(value)
+    return value
+
+
+def _default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _clean(value):
+    if isinstance(value, dict):
+        return {key: _clean(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _clean(value.tolist())
+    if isinstance(value, (float, np.floating)) and not np.isfinite(value):
+        return None
+    return value
+
+
+def figure_spec(fig):
+    """Plotly JSON spec of ``fig`` with long numeric trace arrays sent as base64 typed arrays.
+
+    plotly.js decodes ``{dtype, bdata, shape}`` arrays itself, so a large
+    scatter is encoded with one memory copy instead of a float-to-text
+    conversion per point.
+    """
+    figure = fig.to_dict()
+    figure['data'] = _encode_arrays(figure['data'])
+    if orjson is not None:
+        return orjson.dumps(figure, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    # Like plotly's own encoder, non-finite floats become null
+    return json.dumps(_clean(figure), default=_default, separators=(',', ':'), allow_nan=False)
+
+
+def _figure_bytes(value):
+    if isinstance(value, dict):
+        return sum(_figure_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_figure_bytes(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return len(value) if isinstance(value, str) else 8
+
+
+def _entry_bytes(entry):
+    # Serialized specs are plain strings; figures are sized by the arrays and text they hold
+    return len(entry) if isinstance(entry, str) else _figure_bytes(entry.to_dict())
+
+
+figure_cache = QueryCache(max_entries=int(get_setting('FIGURE_CACHE_SIZE', 256)), ttl=math.inf,
+                          max_bytes=int(float(get_setting('FIGURE_CACHE_MB', 128)) * 1024 * 1024),
+                          weigh=_entry_bytes)
+
+
+def plotly_spec_chart(spec, use_container_width=False):
+    """st.plotly_chart for an already serialized figure, skipping Streamlit's validate and to_json round trip.
+
+    Only valid on SPEC_PATH_VERSIONS: the message fields and widget id inputs
+    mirror st.plotly_chart in those releases.
+    """
+    # st.plotly_chart also calls _enqueue on the main DeltaGenerator; _enqueue itself redirects to the
+    # container of the enclosing `with` block (its _active_dg)
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.spec = spec
+    proto.use_container_width = use_container_width
+    proto.theme = 'streamlit'
+    proto.form_id = current_form_id(dg)
+    proto.config = json.dumps({'showLink': False, 'linkText': False})
+    ctx = get_script_run_ctx()
+    # Same id inputs as st.plotly_chart, so the frontend keeps zoom state across identical reruns
+    proto.id = compute_widget_id('plotly_chart', user_key=None, key=None, plotly_spec=proto.spec,
+                                 plotly_config=proto.config, selection_mode=('points', 'box', 'lasso'),
+                                 is_selection_activated=False, theme='streamlit', form_id=proto.form_id,
+                                 use_container_width=use_container_width,
+                                 page=ctx.active_script_hash if ctx else None)
+    return dg._enqueue('plotly_chart', proto)
+
+
+def cached_chart(key, build, use_container_width=False, **attrs):
+    """Render the figure ``build()`` returns, reusing what is cached under ``key``.
+
+    ``key`` must capture everything the figure depends on: the page's
+    selection state and the dataset version. Entries are shared by every
+    session in the process. On SPEC_PATH_VERSIONS the serialized spec is
+    cached and sent as is; otherwise the built figure is cached and handed
+    to st.plotly_chart.
+    """
+    with span('figure', **attrs) as figure_attrs:
+        figure_attrs['cache'] = 'hit'
+
+        def load():
+            figure_attrs['cache'] = 'miss'
+            fig = build()
+            return figure_spec(fig) if SPEC_PATH else fig
+
+        entry = figure_cache.get_or_load(key, load)
+        if SPEC_PATH:
+            figure_attrs['bytes'] = len(entry)
+    with span('plotly_chart', **attrs):
+        if SPEC_PATH:
+            return plotly_spec_chart(entry, use_container_width)
+        return st.plotly_chart(entry, use_container_width=use_container_width)
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import sqlite3
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from utils.backends import get_setting
+from utils.tracing import propagate
+
+# Cold thumbnails of one model view are downloaded and resized side by side
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='image-fetch')
+
+
+class ImageCache:
+    """Result plots stored once on local disk by content hash, with resized variants.
+
+    Originals live under objects/ and thumbnails under thumbs/, both named by
+    the SHA-256 of the original bytes, so the same plot referenced by several
+    models or URLs is only kept once. When the total size passes max_bytes the
+    least recently viewed images are removed.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, thumbnail_width=640):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_width = thumbnail_width
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'thumbs'), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS objects '
+                               '(digest TEXT PRIMARY KEY, size INTEGER, last_access REAL)')
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and workers
+        return sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=30)
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest)
+
+    def _thumbnail_path(self, digest, width, image_format):
+        return os.path.join(self.root, 'thumbs', f'{digest}_{width}.{image_format.lower()}')
+
+    def _write(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _stored_size(self, digest):
+        # Measured from disk rather than accumulated, so repeated fetches of one object cannot inflate it
+        thumbs = os.path.join(self.root, 'thumbs')
+        size = os.path.getsize(self._object_path(digest))
+        return size + sum(os.path.getsize(os.path.join(thumbs, entry))
+                          for entry in os.listdir(thumbs) if entry.startswith(digest))
+
+    def _download(self, url):
+        if os.path.exists(url):
+            with open(url, 'rb') as f:
+                return f.read()
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.read()
+
+    def _cache_key(self, url):
+        # Local files (snapshot bundles) can be replaced in place, so their key tracks mtime and size
+        if os.path.exists(url):
+            stat = os.stat(url)
+            return f'{url}?{stat.st_mtime_ns}-{stat.st_size}'
+        return url
+
+    def fetch(self, url):
+        """Digest of the image at ``url``, downloading it only if it is not cached yet."""
+        key = self._cache_key(url)
+        with self._connect() as connection:
+            row = connection.execute('SELECT digest FROM urls WHERE url = ?', (key,)).fetchone()
+            if row and os.path.exists(self._object_path(row[0])):
+                connection.execute('UPDATE objects SET last_access = ? WHERE digest = ?', (time.time(), row[0]))
+                return row[0]
+
+        data = self._download(url)
+        digest = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self._object_path(digest)):
+            self._write(self._object_path(digest), data)
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO urls VALUES (?, ?)', (key, digest))
+            connection.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?)',
+                               (digest, self._stored_size(digest), time.time()))
+        self.evict(keep=digest)
+        return digest
+
+    def original(self, url):
+        return self._object_path(self.fetch(url))
+
+    def thumbnail(self, url, width=None):
+        from PIL import Image, features
+
+        width = width or self.thumbnail_width
+        digest = self.fetch(url)
+        image_format = 'WEBP' if features.check('webp') else 'PNG'
+        path = self._thumbnail_path(digest, width, image_format)
+        if os.path.exists(path):
+            return path
+
+        with Image.open(self._object_path(digest)) as image:
+            # Bounded by width only; plots narrower than the thumbnail are kept as they are
+            image.thumbnail((width, image.height))
+            buffer = io.BytesIO()
+            if image_format == 'WEBP':
+                image.save(buffer, image_format, quality=80, method=4)
+            else:
+                image.save(buffer, image_format, optimize=True)
+        self._write(path, buffer.getvalue())
+        with self._connect() as connection:
+            connection.execute('UPDATE objects SET size = ? WHERE digest = ?', (self._stored_size(digest), digest))
+        self.evict(keep=digest)
+        return path
+
+    def warm(self, urls, width=None):
+        """Fetch and resize every uncached thumbnail among ``urls`` concurrently.
+
+        Failures are left for the caller's own ``thumbnail`` call to handle.
+        """
+        futures = [_executor.submit(propagate(self.thumbnail), url, width) for url in urls]
+        for future in futures:
+            future.exception()
+
+    def evict(self, keep=None):
+        """Remove the least recently viewed images until the cache fits, never the ``keep`` digest."""
+        with self._connect() as connection:
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = connection.execute('SELECT digest, size FROM objects ORDER BY last_access').fetchall()
+            for digest, size in rows:
+                if total <= self.max_bytes:
+                    break
+                # The image just fetched is about to be read
+                if digest == keep:
+                    continue
+                for name in [self._object_path(digest)] + [
+                        os.path.join(self.root, 'thumbs', entry)
+                        for entry in os.listdir(os.path.join(self.root, 'thumbs')) if entry.startswith(digest)]:
+                    try:
+                        os.remove(name)
+                    except FileNotFoundError:
+                        pass
+                connection.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+                connection.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+                total -= size
+
+
+@st.cache_resource
+def get_image_cache():
+    return ImageCache(get_setting('IMAGE_CACHE_DIR', 'data/.image_cache'),
+                      max_bytes=int(float(get_setting('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024),
+                      thumbnail_width=int(get_setting('IMAGE_THUMBNAIL_WIDTH', 640)))
@@ -0,0 +1,80 @@
+import numpy as np
+
+BLOCK_ROWS = 65_536
+QUERY_CELLS = 1 << 24
+
+
+class NeighbourIndex:
+    """Exact k-nearest-neighbour search over a standardized float32 feature matrix.
+
+    Every feature is centred and scaled to unit variance, with missing values
+    set to the mean, so no single feature dominates the Euclidean distance.
+    A query is one matrix product per block of rows, using
+    |a - b|^2 = |a|^2 - 2 a.b + |b|^2 with precomputed row norms, and keeps
+    only the k best candidates from each block.
+    """
+
+    def __init__(self, frame, features, block_rows=BLOCK_ROWS):
+        self.features = list(features)
+        self.block_rows = block_rows
+        self.means = np.zeros(len(self.features))
+        self.scales = np.ones(len(self.features))
+        matrix = np.empty((len(frame), len(self.features)), dtype=np.float32)
+        for j, feature in enumerate(self.features):
+            values = np.asarray(frame[feature], dtype=np.float64)
+            mean, std = np.nanmean(values), np.nanstd(values)
+            # Constant columns carry no distance information but must not divide by zero
+            self.means[j], self.scales[j] = mean, (std if std > 0 else 1.0)
+            matrix[:, j] = np.nan_to_num((values - mean) / self.scales[j])
+        self.matrix = matrix
+        self.norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    def standardize(self, frame):
+        """Rows of ``frame`` scaled the same way as the indexed matrix, for querying with new batteries."""
+        matrix = np.empty((len(frame), len(self.features)), dtype=np.float32)
+        for j, feature in enumerate(self.features):
+            values = np.asarray(frame[feature], dtype=np.float64)
+            matrix[:, j] = np.nan_to_num((values - self.means[j]) / self.scales[j])
+        return matrix
+
+    def kneighbors(self, vectors, k=10):
+        """Rows and distances of the k nearest indexed batteries to each standardized vector, nearest first."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        k = min(k, len(self.matrix))
+        rows = np.empty((len(vectors), k), dtype=np.intp)
+        distances = np.empty((len(vectors), k))
+        # Queries go in batches so each distance block stays around QUERY_CELLS entries
+        batch = max(1, QUERY_CELLS // self.block_rows)
+        for first in range(0, len(vectors), batch):
+            queries = vectors[first:first + batch]
+            query_norms = np.einsum('ij,ij->i', queries, queries)
+            best_rows = np.empty((len(queries), 0), dtype=np.intp)
+            best = np.empty((len(queries), 0))
+            for start in range(0, len(self.matrix), self.block_rows):
+                block = slice(start, start + self.block_rows)
+                squared = self.norms[block] - 2 * (queries @ self.matrix[block].T) + query_norms[:, None]
+                if squared.shape[1] > k:
+                    top = np.argpartition(squared, k - 1, axis=1)[:, :k]
+                else:
+                    top = np.broadcast_to(np.arange(squared.shape[1]), squared.shape)
+                best_rows = np.concatenate([best_rows, top + start], axis=1)
+                best = np.concatenate([best, np.take_along_axis(squared, top, axis=1)], axis=1)
+                if best.shape[1] > k:
+                    keep = np.argpartition(best, k - 1, axis=1)[:, :k]
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                    best = np.take_along_axis(best, keep, axis=1)
+            # The expanded form loses precision to cancellation, so the survivors are measured directly
+            exact = np.sqrt(((self.matrix[best_rows] - queries[:, None, :]) ** 2).sum(axis=2, dtype=np.float64))
+            order = np.argsort(exact, axis=1, kind='stable')
+            rows[first:first + batch] = np.take_along_axis(best_rows, order, axis=1)
+            distances[first:first + batch] = np.take_along_axis(exact, order, axis=1)
+        return rows, distances
+
+    def query(self, row, k=10, exclude_self=True):
+        """Rows of the k nearest batteries to indexed ``row``, nearest first, and their distances."""
+        rows, distances = self.kneighbors(self.matrix[row], k + 1 if exclude_self else k)
+        rows, distances = rows[0], distances[0]
+        if exclude_self:
+            keep = rows != row
+            rows, distances = rows[keep][:k], distances[keep][:k]
+        return rows, distances
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from utils.stats_index import finite_values
+
+
+class PercentileIndex:
+    """Percentile ranks of chosen rows against every battery, per feature.
+
+    Each feature column is sorted once (NaNs dropped) on first use; ranking a
+    shortlist is then two binary searches per value instead of a scan of the
+    whole column. Ties count as half below, so a value equal to every other
+    battery ranks at the 50th percentile.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._sorted = {}
+
+    def sorted_values(self, feature):
+        values = self._sorted.get(feature)
+        if values is None:
+            # Kept in the column's own dtype so looked-up values compare exactly
+            values = self._sorted[feature] = finite_values(self.frame[feature], ordered=True, dtype=None)
+        return values
+
+    def ranks(self, rows, features):
+        """Frame of percentile ranks (0-100), one row per entry of ``rows`` and one column per feature."""
+        rows = np.asarray(rows, dtype=np.intp)
+        ranks = np.full((len(rows), len(features)), np.nan)
+        for j, feature in enumerate(features):
+            ordered = self.sorted_values(feature)
+            if len(ordered) == 0:
+                continue
+            values = np.asarray(self.frame[feature].iloc[rows])
+            below = np.searchsorted(ordered, values, side='left')
+            not_above = np.searchsorted(ordered, values, side='right')
+            ranks[:, j] = (below + not_above) * (50.0 / len(ordered))
+            if values.dtype.kind == 'f':
+                ranks[np.isnan(values), j] = np.nan
+        return pd.DataFrame(ranks, columns=list(features))
@@ -0,0 +1,77 @@
+import numpy as np
+import plotly.graph_objects as go
+
+
+def box_traces(summary, x, name, color, line_color, show_outliers=False):
+    """Box (and optional outlier markers) drawn from a precomputed box summary.
+
+    Only the five box values and the bounded outlier sample are sent to the
+    browser, so the figure size no longer depends on the number of rows.
+    """
+    if summary is None:
+        return []
+    traces = [go.Box(
+        x=[x],
+        q1=[summary['q1']],
+        median=[summary['median']],
+        q3=[summary['q3']],
+        lowerfence=[summary['lowerfence']],
+        upperfence=[summary['upperfence']],
+        name=name,
+        boxpoints=False,
+        showlegend=False,
+        marker_color=color,
+        line_color=line_color
+    )]
+    if show_outliers and len(summary['outliers']):
+        traces.append(go.Scatter(
+            x=[x] * len(summary['outliers']),
+            y=summary['outliers'],
+            mode='markers',
+            name=name,
+            showlegend=False,
+            marker=dict(color=line_color, size=4, opacity=0.6)
+        ))
+    return traces
+
+
+# Point counts at which t-SNE scatters switch from SVG to WebGL, and from points to a binned raster
+WEBGL_THRESHOLD = 5_000
+DENSITY_THRESHOLD = 100_000
+
+
+def scatter_render_mode(num_points):
+    if num_points > DENSITY_THRESHOLD:
+        return 'density'
+    if num_points > WEBGL_THRESHOLD:
+        return 'webgl'
+    return 'svg'
+
+
+def density_raster(x, y, target, x_range, y_range, bins=120):
+    """Point counts and mean target per cell of a bins x bins grid over the given ranges."""
+    x, y, target = (np.asarray(a, dtype=np.float64) for a in (x, y, target))
+    bounds = [x_range, y_range]
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=bounds)
+    valid = ~np.isnan(target)
+    sums, _, _ = np.histogram2d(x[valid], y[valid], bins=bins, range=bounds, weights=target[valid])
+    target_counts, _, _ = np.histogram2d(x[valid], y[valid], bins=bins, range=bounds)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / target_counts
+    return counts, means, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+
+
+def density_figure(plot_data, target_name, x_range, y_range, bins=120):
+    counts, means, x_centers, y_centers = density_raster(
+        plot_data['x'], plot_data['y'], plot_data['target'], x_range, y_range, bins)
+    # histogram2d is indexed [x, y]; heatmaps want rows along y
+    return go.Figure(go.Heatmap(
+        x=x_centers,
+        y=y_centers,
+        z=means.T,
+        customdata=counts.T,
+        colorscale='Spectral',
+        colorbar=dict(title=target_name),
+        hovertemplate='t-SNE 1: %{x:.2f}<br>t-SNE 2: %{y:.2f}<br>mean ' + target_name
+                      + ': %{z:.3f}<br>batteries: %{customdata:.0f}<extra></extra>'
+    ))
@@ -0,0 +1,106 @@
+"""Warm a worker's caches before it takes traffic, and report how long each step took.
+
+    python -m utils.prewarm                            # warm and exit, e.g. as a deploy check
+    python -m utils.prewarm --serve app.py [args...]   # warm, then start the Streamlit server in this process
+
+Warming and exiting only leaves the on-disk caches behind (the dataset's
+column store), which still spares the first worker on a volume the CSV
+conversion. With --serve the in-memory caches (dataset and its indexes,
+t-SNE maps, results connection and model tables) belong to the process
+that serves, so the first session finds them ready. The timings also go
+to the TRACE_LOG JSON log as spans of one 'prewarm' trace.
+"""
+import argparse
+
+
+def _imports():
+    # Imported only so the pages find them in sys.modules
+    import pandas  # noqa: F401
+    import plotly.express  # noqa: F401
+    import plotly.graph_objects as go
+
+    from utils.figure_cache import figure_spec
+
+    # plotly builds each trace type's validators on first use, which costs more than the imports
+    figure_spec(go.Figure([go.Box(), go.Scatter(), go.Scattergl(), go.Heatmap()]))
+
+
+def _dataset():
+    from utils.battery_data import get_dataset
+    return get_dataset()
+
+
+def _indexes(dataset):
+    from utils.features import feature_dictionary
+
+    for index in ('stats', 'boxes', 'elements'):
+        getattr(dataset, index)
+    for feature in dataset.features:
+        dataset.percentiles.sorted_values(feature)
+    # The Similar Batteries tab opens on Battery Properties
+    dataset.neighbours(feature_dictionary['Battery Properties'])
+
+
+def _element_stats(dataset):
+    from utils.battery_data import start_element_precompute
+    start_element_precompute(dataset).join()
+
+
+def _tsne():
+    from utils.tsne_data import load_data
+    load_data()
+
+
+def _results():
+    from utils.backends import get_backend
+    from utils.results_funcs import MODEL_TABLES, model_index
+
+    backend = get_backend()
+    for model_type in MODEL_TABLES:
+        model_index(backend, model_type)
+
+
+def prewarm():
+    """Run every warm-up step in order; returns the trace holding one span per step."""
+    from utils.backends import get_setting
+    from utils.battery_data import element_precompute_enabled
+    from utils.tracing import configure_logging, span, trace
+
+    configure_logging(get_setting('TRACE_LOG'))
+    with trace('prewarm') as run:
+        with span('prewarm_imports'):
+            _imports()
+        with span('prewarm_dataset'):
+            dataset = _dataset()
+        with span('prewarm_indexes', features=len(dataset.features)):
+            _indexes(dataset)
+        if element_precompute_enabled():
+            with span('prewarm_element_stats'):
+                _element_stats(dataset)
+        with span('prewarm_tsne'):
+            _tsne()
+        with span('prewarm_results'):
+            _results()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serve', nargs=argparse.REMAINDER, metavar='SCRIPT',
+                        help='after warming, run `streamlit run SCRIPT [args...]` in this process')
+    args = parser.parse_args()
+
+    run = prewarm()
+    # The steps' own spans (dataset_load, query, ...) are in the trace too, only the steps are listed
+    for record in run.spans:
+        if record['span'].startswith('prewarm_'):
+            print(f"{record['span'][len('prewarm_'):]:<24}{record['duration_ms']:>10.0f} ms")
+    print(f"{'total':<24}{run.duration_ms:>10.0f} ms", flush=True)
+
+    if args.serve:
+        from streamlit.web import cli
+        cli.main(['run', *args.serve], prog_name='streamlit')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """Thread-safe LRU cache with a per-entry TTL, shared by every session in the process.
+
+    With ``max_bytes`` set, ``weigh(value)`` sizes each entry and the least
+    recently used entries are evicted until the total fits as well.
+    """
+
+    def __init__(self, max_entries=512, ttl=600, clock=time.monotonic, max_bytes=None, weigh=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._weigh = weigh
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get_or_load(self, key, loader):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Loaded outside the lock so one slow query does not block other keys
+        value = loader()
+        size = self._weigh(value) if self._weigh else 0
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (now + self.ttl, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1):
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self.bytes = 0
+            else:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
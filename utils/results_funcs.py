@@ -0,0 +1,186 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.tracing import propagate
+
+MODEL_TABLES = {
+    'Linear Regression': 'regression_models',
+    'XGBoost': 'xgboost_models',
+}
+
+# Detail tables per model type; each is queried once per model, all at the same time
+DETAIL_TABLES = {
+    'Linear Regression': {
+        'visualizations': 'visualizations',
+        'selected_features': 'selected_features',
+        'feature_importance': 'feature_importance',
+        'coefficient_info': 'coefficient_info',
+    },
+    'XGBoost': {
+        'visualizations': 'xgboost_visualizations',
+        'selected_features': 'xgboost_selected_features',
+        'feature_importance': 'xgboost_feature_importance',
+        'hyperparameters': 'xgboost_hyperparameters',
+    },
+}
+
+# Columns that put each table's rows in one fixed order, for paging through a whole table
+TABLE_ORDER = {
+    'regression_models': ('id',),
+    'visualizations': ('model_id', 'vis_type'),
+    'selected_features': ('model_id', 'feature_name'),
+    'feature_importance': ('model_id', 'feature_name'),
+    'coefficient_info': ('model_id', 'feature_name'),
+    'xgboost_models': ('id',),
+    'xgboost_visualizations': ('model_id', 'vis_type'),
+    'xgboost_selected_features': ('model_id', 'feature_name'),
+    'xgboost_feature_importance': ('model_id', 'feature_name'),
+    'xgboost_hyperparameters': ('model_id',),
+}
+
+VISUAL_BUCKETS = {
+    'Linear Regression': 'Visualisations',
+    'XGBoost': 'Tree_Visuals',
+}
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='results-fetch')
+# Separate and small, so background warm-up never queues ahead of a page's own queries
+PREFETCH_WORKERS = 2
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='results-prefetch')
+
+
+class ModelIndex:
+    """Model rows keyed by (feature subset, response variable), plus targets per subset."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._models = {}
+        self._targets = {}
+        for row in rows:
+            subset = frozenset(row['feature_subset'])
+            key = (subset, row['response_variable'])
+            # First row wins, as the page assumes one result per combination
+            if key not in self._models:
+                self._models[key] = row
+                self._targets.setdefault(subset, []).append(row['response_variable'])
+
+    def targets(self, feature_subset):
+        return self._targets.get(frozenset(feature_subset), [])
+
+    def get(self, feature_subset, response_variable):
+        return self._models.get((frozenset(feature_subset), response_variable))
+
+
+_model_indexes = {}
+
+
+def model_index(backend, model_type):
+    # Rebuilt only when the backend hands back a different row list, i.e. after a cache refresh
+    rows = backend.select(MODEL_TABLES[model_type])
+    index = _model_indexes.get(model_type)
+    if index is None or index.rows is not rows:
+        index = ModelIndex(rows)
+        _model_indexes[model_type] = index
+    return index
+
+
+METRICS = ['r_squared', 'rmse', 'mae']
+
+
+def metrics_frame(backend):
+    """Test metrics of every model of every type, one row per (model type, feature subset, target)."""
+    frames = []
+    for model_type in MODEL_TABLES:
+        rows = model_index(backend, model_type).rows
+        frame = pd.DataFrame(rows, columns=['id', 'feature_subset', 'response_variable'] + METRICS)
+        frame.insert(0, 'model_type', model_type)
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    # Subsets are unordered, so equal sets share a label whatever order they were stored in
+    frame['feature_subset'] = frame['feature_subset'].map(lambda subset: ' + '.join(sorted(subset)))
+    return frame.drop_duplicates(['model_type', 'feature_subset', 'response_variable'], keep='first')
+
+
+def visual_urls(backend, model_type, visualizations):
+    # First file per vis_type, the same row the per-type queries used to return
+    bucket = VISUAL_BUCKETS[model_type]
+    urls = {}
+    for row in visualizations:
+        if row['vis_type'] not in urls:
+            urls[row['vis_type']] = backend.public_url(bucket, row['file_path'])
+    # Backends without object storage return None; those plots show as unavailable
+    return {vis_type: url for vis_type, url in urls.items() if url is not None}
+
+
+def fetch_model_details(backend, model_id, model_type):
+    """Everything the detail view needs for one model, in one concurrent round of queries."""
+    tables = DETAIL_TABLES[model_type]
+    futures = {key: _executor.submit(propagate(backend.select), table_name, model_id=model_id)
+               for key, table_name in tables.items()}
+    details = {key: future.result() for key, future in futures.items()}
+    details['urls'] = visual_urls(backend, model_type, details['visualizations'])
+    return details
+
+
+class Prefetch:
+    """Background warm-up of the backend cache for a list of models.
+
+    Each model's detail queries run one after another on the shared prefetch
+    pool, followed by the thumbnails of its plots in ``image_cache``. Both
+    are passed in from the script thread: the pool threads have no script
+    run context for st.cache_resource to use. cancel() drops models that have not started and stops running ones
+    before their next query or image.
+    """
+
+    def __init__(self, key, backend, image_cache, model_type, models):
+        self.key = key
+        self._cancelled = threading.Event()
+        self._futures = [_prefetch_executor.submit(self._warm, backend, image_cache, model_type, model['id'])
+                         for model in models]
+
+    def _warm(self, backend, image_cache, model_type, model_id):
+        details = {}
+        for key, table_name in DETAIL_TABLES[model_type].items():
+            if self._cancelled.is_set():
+                return
+            details[key] = backend.select(table_name, model_id=model_id)
+        for url in visual_urls(backend, model_type, details['visualizations']).values():
+            if self._cancelled.is_set():
+                return
+            try:
+                image_cache.thumbnail(url)
+            except Exception:
+                # The page falls back to the storage URL for images that cannot be cached
+                pass
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+
+    def done(self):
+        return all(future.done() for future in self._futures)
+
+
+def prefetch_other_targets(state, backend, image_cache, model_type, index, feature_subset, current_target):
+    """Warm the cache for the other targets of ``feature_subset``, replacing this session's previous prefetch.
+
+    ``state`` is the session state; targets after the current one come first,
+    in the order the target list steps through them.
+    """
+    state_key = f'prefetch_{model_type}'
+    key = frozenset(feature_subset)
+    previous = state.get(state_key)
+    if previous is not None:
+        if previous.key == key:
+            return previous
+        previous.cancel()
+
+    targets = index.targets(feature_subset)
+    start = targets.index(current_target) + 1 if current_target in targets else 0
+    models = [index.get(feature_subset, target) for target in targets[start:] + targets[:start]
+              if target != current_target]
+    state[state_key] = Prefetch(key, backend, image_cache, model_type, models)
+    return state[state_key]
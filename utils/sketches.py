@@ -0,0 +1,112 @@
+import numpy as np
+
+SKETCH_K = 8192
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch, a simplified KLL compactor stack.
+
+    Level i holds items that each stand for 2**i values. A level that grows
+    past k is sorted and every other item is promoted to the next level, so
+    memory stays around k items per level while rank error stays near 1/k.
+    Until the first compaction the sketch holds every value and its
+    quantiles are exact.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._offset = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # An odd item out stays behind at its own weight
+                keep, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                # Alternate which half survives so compactions do not drift one way
+                promoted = items[self._offset::2]
+                self._offset ^= 1
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        # Each item covers a run of ranks; interpolate between the centres of those runs
+        centres = np.cumsum(weights) - (weights + 1) / 2
+        return np.interp(qs * (self.count - 1), centres, items)
+
+
+class ColumnSketch:
+    """Running min, max, mean and variance plus a quantile sketch for one numeric column."""
+
+    def __init__(self, k=SKETCH_K):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.quantile_sketch = QuantileSketch(k)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        chunk = ColumnSketch(self.quantile_sketch.k)
+        chunk.count, chunk.mean = len(values), values.mean()
+        chunk.m2 = ((values - chunk.mean) ** 2).sum()
+        chunk.min, chunk.max = values.min(), values.max()
+        chunk.quantile_sketch.update(values)
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        # Chan et al.'s pairwise update keeps the variance stable across many chunks
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.quantile_sketch.merge(other.quantile_sketch)
+
+    def summary(self):
+        """Statistics keyed like stats_index.STAT_NAMES; NaN for a column with no values."""
+        if self.count == 0:
+            return dict.fromkeys(['min', 'q1', 'median', 'mean', 'q3', 'max', 'std'], float('nan'))
+        q1, median, q3 = self.quantile_sketch.quantiles([0.25, 0.5, 0.75])
+        std = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+        return {'min': float(self.min), 'q1': float(q1), 'median': float(median), 'mean': float(self.mean),
+                'q3': float(q3), 'max': float(self.max), 'std': float(std)}
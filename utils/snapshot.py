@@ -0,0 +1,119 @@
+"""Export every table the Results page reads, plus the plots they reference, into one local bundle.
+
+    python -m utils.snapshot --out data/snapshot
+
+The bundle is a directory holding results.sqlite (one table per Supabase table,
+indexed on model_id), storage/<bucket>/<path> for each visualisation file and a
+manifest.json. The directory given with --out is a symlink to the latest
+export, so re-exporting swaps the bundle under a running app. Point the app
+at it with RESULTS_BACKEND=snapshot and RESULTS_SNAPSHOT_DIR=<dir>.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+from utils.backends import SQLiteBackend, SupabaseBackend, get_setting
+from utils.results_funcs import DETAIL_TABLES, MODEL_TABLES, TABLE_ORDER, VISUAL_BUCKETS
+
+SNAPSHOT_DB = 'results.sqlite'
+SNAPSHOT_STORAGE = 'storage'
+PAGE_SIZE = 1000
+
+
+def select_all(client, table_name, order_by):
+    # PostgREST caps each response, so page through the table explicitly. Without an order on unique
+    # columns the pages are not guaranteed to line up, and rows could be repeated or skipped.
+    rows = []
+    while True:
+        query = client.table(table_name).select('*')
+        for column in order_by:
+            query = query.order(column)
+        page = query.range(len(rows), len(rows) + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def _export_to(client, build_dir, include_storage):
+    database = SQLiteBackend(os.path.join(build_dir, SNAPSHOT_DB))
+
+    counts = {}
+    for model_type, model_table in MODEL_TABLES.items():
+        for table_name in [model_table] + list(DETAIL_TABLES[model_type].values()):
+            rows = select_all(client, table_name, TABLE_ORDER[table_name])
+            database.write_table(table_name, rows)
+            counts[table_name] = len(rows)
+            print(f'{table_name}: {len(rows)} rows')
+
+        if include_storage:
+            bucket = client.storage.from_(VISUAL_BUCKETS[model_type])
+            paths = {row['file_path'] for row in database.select(DETAIL_TABLES[model_type]['visualizations'])}
+            for path in sorted(paths):
+                target = os.path.join(build_dir, SNAPSHOT_STORAGE, VISUAL_BUCKETS[model_type], path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(bucket.download(path))
+            print(f'{VISUAL_BUCKETS[model_type]}: {len(paths)} files')
+    database.connection.close()
+
+    with open(os.path.join(build_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'tables': counts}, f, indent=1)
+
+
+def _remove_old_versions(out_dir, keep):
+    parent, base = os.path.split(os.path.abspath(out_dir))
+    for entry in os.listdir(parent):
+        if entry.startswith(f'{base}.v') and entry not in keep:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def export_snapshot(client, out_dir, include_storage=True):
+    """Export into a new versioned directory, then point the ``out_dir`` symlink at it.
+
+    The symlink is replaced in one rename, so ``out_dir`` always resolves to
+    a complete bundle. The bundle it pointed at before is kept for readers
+    that still have files open in it; older ones are removed.
+    """
+    out_dir = out_dir.rstrip(os.sep)
+    build_dir = f'{out_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    try:
+        _export_to(client, build_dir, include_storage)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    version_dir = f'{out_dir}.v{time.time_ns()}'
+    os.rename(build_dir, version_dir)
+    previous = os.path.basename(os.readlink(out_dir)) if os.path.islink(out_dir) else None
+    if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+        # A bundle from before versioned exports: a plain directory cannot be swapped for a link atomically,
+        # so this one time it is moved aside first
+        shutil.rmtree(f'{out_dir}.old', ignore_errors=True)
+        os.rename(out_dir, f'{out_dir}.old')
+    link_path = f'{out_dir}.{os.getpid()}.link'
+    os.symlink(os.path.basename(version_dir), link_path)
+    os.replace(link_path, out_dir)
+    shutil.rmtree(f'{out_dir}.old', ignore_errors=True)
+    _remove_old_versions(out_dir, {os.path.basename(version_dir), previous})
+
+
+def open_snapshot(snapshot_dir):
+    return SQLiteBackend(os.path.join(snapshot_dir, SNAPSHOT_DB), os.path.join(snapshot_dir, SNAPSHOT_STORAGE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default='data/snapshot', help='bundle directory to create or replace')
+    parser.add_argument('--skip-storage', action='store_true', help='export tables only, no plot files')
+    args = parser.parse_args()
+
+    backend = SupabaseBackend.connect(get_setting('SUPABASE_URL'), get_setting('SUPABASE_KEY'))
+    export_snapshot(backend.client, args.out, include_storage=not args.skip_storage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+STAT_NAMES = ['min', 'q1', 'median', 'mean', 'q3', 'max', 'std']
+
+
+def finite_values(values, ordered=False, dtype=np.float64):
+    """The non-NaN values of a column, sorted if ``ordered``.
+
+    Sparse columns only sort their stored entries and splice the implicit
+    zeros back in, which always yields a sorted result.
+    """
+    values = getattr(values, 'array', values)
+    if isinstance(values, pd.arrays.SparseArray) and values.fill_value == 0:
+        stored = np.asarray(values.sp_values, dtype=dtype)
+        if stored.dtype.kind == 'f':
+            stored = stored[~np.isnan(stored)]
+        stored = np.sort(stored)
+        split = np.searchsorted(stored, 0)
+        zeros = np.zeros(len(values) - values.npoints, dtype=stored.dtype)
+        return np.concatenate([stored[:split], zeros, stored[split:]])
+    values = np.asarray(values, dtype=dtype)
+    if values.dtype.kind == 'f':
+        values = values[~np.isnan(values)]
+    return np.sort(values) if ordered else values
+
+
+def column_stats(values):
+    # Same semantics as pandas agg/quantile: NaNs skipped, linear quantiles, sample std
+    values = finite_values(values)
+    if len(values) == 0:
+        return [np.nan] * len(STAT_NAMES)
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    std = values.std(ddof=1) if len(values) > 1 else np.nan
+    return [values.min(), q1, median, values.mean(), q3, values.max(), std]
+
+
+def build_stats_index(frame, columns):
+    """One row of summary statistics per column, computed in a single pass each."""
+    return pd.DataFrame([column_stats(frame[name]) for name in columns], index=list(columns), columns=STAT_NAMES)
+
+
+def lookup_stats(index, features):
+    # Statistics as rows, features as columns, the layout the viewer tables use
+    return index.loc[list(features)].T
+
+
+def box_summary(values, max_outliers=50):
+    """Quartiles, Tukey fences and an evenly spaced sample of the outliers.
+
+    Matches plotly's default box drawing: linear quartiles and whiskers at the
+    furthest points within 1.5 IQR of the box.
+    """
+    values = finite_values(values, ordered=True)
+    if len(values) == 0:
+        return None
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    start, stop = np.searchsorted(values, low, side='left'), np.searchsorted(values, high, side='right')
+    outliers = np.concatenate([values[:start], values[stop:]])
+    if len(outliers) > max_outliers:
+        outliers = outliers[np.linspace(0, len(outliers) - 1, max_outliers).astype(int)]
+    return {'q1': q1, 'median': median, 'q3': q3, 'mean': values.mean(),
+            'lowerfence': values[start], 'upperfence': values[stop - 1], 'outliers': outliers}
+
+
+def build_box_index(frame, columns, max_outliers=50):
+    return {name: box_summary(frame[name], max_outliers) for name in columns}
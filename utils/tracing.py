@@ -0,0 +1,128 @@
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('battimpact.trace')
+_local = threading.local()
+
+
+class Trace:
+    """Spans recorded during one script rerun, in the order they finished."""
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def _emit(record):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+
+
+@contextlib.contextmanager
+def trace(name, **attrs):
+    previous = current_trace()
+    rerun = Trace(name, **attrs)
+    _local.trace = rerun
+    try:
+        yield rerun
+    finally:
+        rerun.duration_ms = (time.perf_counter() - rerun.start) * 1000
+        _local.trace = previous
+        _emit({'trace': rerun.id, 'name': name, 'duration_ms': round(rerun.duration_ms, 3),
+               'spans': len(rerun.spans), **attrs})
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a block; the record goes to the JSON log and to the active rerun trace, if any."""
+    rerun = current_trace()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        end = time.perf_counter()
+        record = {
+            'trace': rerun.id if rerun else None,
+            'span': name,
+            'start_ms': round((start - rerun.start) * 1000, 3) if rerun else None,
+            'duration_ms': round((end - start) * 1000, 3),
+            'thread': threading.current_thread().name,
+            **attrs,
+        }
+        if rerun is not None:
+            rerun.add(record)
+        _emit(record)
+
+
+def propagate(fn):
+    """Bind fn to the caller's trace so spans from worker threads land in the same rerun."""
+    rerun = current_trace()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = current_trace()
+        _local.trace = rerun
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return wrapper
+
+
+def configure_logging(path):
+    # JSON lines, one per span and one per rerun; configured once per process
+    if path is None or any(getattr(h, '_battimpact_trace', False) for h in logger.handlers):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler._battimpact_trace = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def render_panel(rerun):
+    import plotly.graph_objects as go
+    import streamlit as st
+
+    spans = sorted(rerun.spans, key=lambda record: record['start_ms'])
+    with st.sidebar:
+        st.markdown(f"**Rerun timings** ({rerun.duration_ms:.0f} ms total)")
+        if not spans:
+            st.write("No spans recorded for this rerun.")
+            return
+        labels = [f"{i + 1}. {record['span']}" for i, record in enumerate(spans)]
+        fig = go.Figure(go.Bar(
+            y=labels,
+            x=[record['duration_ms'] for record in spans],
+            base=[record['start_ms'] for record in spans],
+            orientation='h',
+            hovertext=[json.dumps({k: v for k, v in record.items() if k not in ('trace', 'span')}, default=str)
+                       for record in spans],
+            marker_color='darkblue'
+        ))
+        fig.update_layout(
+            xaxis_title="ms since rerun start",
+            yaxis=dict(autorange='reversed'),
+            height=max(200, 24 * len(spans) + 80),
+            margin=dict(l=0, r=0, t=10, b=0)
+        )
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,123 @@
+import ast
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.backends import get_setting
+from utils.column_store import open_store, source_signature
+from utils.features import feature_dictionary
+from utils.neighbour_index import NeighbourIndex
+from utils.tracing import span
+
+RESULTS_PATH = 'data/tsne_results.csv'
+EVALUATIONS_PATH = 'data/tsne_evaluations.csv'
+PROJECTION_NEIGHBOURS = 10
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading t-SNE results...")
+def _load_results(signature):
+    return open_store(RESULTS_PATH, categorical=['battery_id'])
+
+
+@st.cache_data(max_entries=1)
+def _load_evaluations(signature):
+    return pd.read_csv(EVALUATIONS_PATH)
+
+
+def load_data():
+    # Both caches are keyed on the source files' mtime/size, so edited CSVs are picked up on the next rerun
+    with span('tsne_load'):
+        results = _load_results(tuple(source_signature(RESULTS_PATH)))
+        evaluations = _load_evaluations(tuple(source_signature(EVALUATIONS_PATH)))
+    return results, evaluations
+
+
+def embedding_subsets(results):
+    return [col[:-len('_x')] for col in results.columns if col.endswith('_x')]
+
+
+def plot_frame(results, subset, target):
+    # Only the three mapped columns a view needs are paged in
+    return pd.DataFrame({
+        'x': results.column(f'{subset}_x'),
+        'y': results.column(f'{subset}_y'),
+        'target': results.column(target),
+    }, copy=False)
+
+
+def subset_key(subset):
+    # Maps over several subsets are named after the tuple of subset names, e.g. "('A', 'B')"
+    return ast.literal_eval(subset) if subset.startswith('(') else subset
+
+
+def subset_features(subset):
+    key = subset_key(subset)
+    names = key if isinstance(key, tuple) else (key,)
+    return list(dict.fromkeys(feature for name in names for feature in feature_dictionary[name]))
+
+
+class MapProjection:
+    """Places batteries into an existing t-SNE map without re-running t-SNE.
+
+    Each battery lands at the inverse-distance weighted mean of the map
+    coordinates of its nearest mapped batteries, measured in the subset's
+    standardized feature space.
+    """
+
+    def __init__(self, frame, x, y, features, k=PROJECTION_NEIGHBOURS):
+        self.index = NeighbourIndex(frame, features)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.k = k
+
+    def project(self, frame):
+        """Map coordinates (x, y) for each row of ``frame``, which must hold the subset's features."""
+        if not len(self.x):
+            raise ValueError("none of the batteries in this map are in the current dataset")
+        rows, distances = self.index.kneighbors(self.index.standardize(frame), self.k)
+        # A battery identical to a mapped one lands on it
+        weights = 1 / np.maximum(distances, 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return (weights * self.x[rows]).sum(axis=1), (weights * self.y[rows]).sum(axis=1)
+
+
+def mapped_rows(results, dataset):
+    """Dataset row of every battery in the t-SNE map, -1 for those no longer in the dataset."""
+    return dataset.rows_for(np.asarray(results.column('battery_id')), strict=False)
+
+
+def unmapped_rows(results, dataset):
+    """Dataset rows of batteries added since the t-SNE map was computed."""
+    rows = mapped_rows(results, dataset)
+    unmapped = np.ones(len(dataset.frame), dtype=bool)
+    unmapped[rows[rows >= 0]] = False
+    return np.flatnonzero(unmapped)
+
+
+@st.cache_resource(max_entries=4, show_spinner="Indexing the t-SNE map...")
+def _map_projection(_results, _dataset, results_version, dataset_version, subset):
+    rows = mapped_rows(_results, _dataset)
+    mapped = rows >= 0
+    features = subset_features(subset)
+    return MapProjection(_dataset.feature_frame(features, rows[mapped]),
+                         np.asarray(_results.column(f'{subset}_x'))[mapped],
+                         np.asarray(_results.column(f'{subset}_y'))[mapped], features)
+
+
+def map_projection(results, dataset, subset):
+    # Built once per map, dataset version and subset, then shared by every session
+    return _map_projection(results, dataset, results.version, dataset.version, subset)
+
+
+@st.cache_data(max_entries=16, show_spinner="Scoring the t-SNE map...")
+def _embedding_scores(_results, _dataset, results_version, dataset_version, subset, workers):
+    from utils.embedding_quality import evaluate_subset
+    return evaluate_subset(_results, _dataset, subset, workers=workers)
+
+
+def embedding_scores(results, dataset, subset):
+    """Trustworthiness, continuity and KL divergence of one map, recomputed against the current dataset."""
+    # Runs inside the app server for whoever clicks, so it stays in-process unless EMBEDDING_WORKERS says otherwise
+    return _embedding_scores(results, dataset, results.version, dataset.version, subset,
+                             int(get_setting('EMBEDDING_WORKERS', 1)))